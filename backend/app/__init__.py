@@ -1,7 +1,10 @@
+import logging
+
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
 
 from .core.config import settings
+from .core.cors import FastCORSMiddleware
+from .core.responses import ORJSONResponse
 # routers
 from .api.v1 import health as health_router
 from .api.v1 import s3 as s3_router
@@ -9,20 +12,40 @@ from .api.v1 import data_sync as data_router
 from .api.v1 import db as db_router
 from .api.v1 import files as files_router
 from .api.v1 import evaluation as evaluation_router
+from .services.evaluation_runner_service import close_http_session
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="My App API", version="1.0.0")
+    app = FastAPI(title="My App API", version="1.0.0", default_response_class=ORJSONResponse)
 
     # CORS configuration
     app.add_middleware(
-        CORSMiddleware,
+        FastCORSMiddleware,
         allow_origins=settings.cors_origins,
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
     )
 
+    # Report missing DB settings once at startup; non-DB endpoints keep working
+    @app.on_event("startup")
+    async def _check_db_env() -> None:
+        missing = db_router.missing_env_vars()
+        if missing:
+            logging.getLogger(__name__).warning(
+                "Missing DB env vars: %s - database endpoints will fail", ", ".join(missing)
+            )
+
+    # Close the shared DB pool on shutdown
+    @app.on_event("shutdown")
+    async def _close_db_pool() -> None:
+        await db_router.close_pool()
+
+    # Close the shared extraction API HTTP session on shutdown
+    @app.on_event("shutdown")
+    async def _close_http_session() -> None:
+        await close_http_session()
+
     # Register routers
     app.include_router(health_router.router)
     app.include_router(s3_router.router)
@@ -1,35 +1,127 @@
 """DB utilities endpoints – MySQL / Aurora-MySQL."""
 from __future__ import annotations
 
+import asyncio
 import os
+from typing import AsyncIterator, Optional
+
 import aiomysql
+import orjson
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from ...core.responses import ORJSONResponse, json_default
 
 router = APIRouter()
 
 # -------------------------------------------------------------------------
 # Helpers
 # -------------------------------------------------------------------------
+REQUIRED_ENV_VARS = ("DB_HOST", "DB_USER", "DB_PASSWORD")
+
+
+def missing_env_vars() -> list[str]:
+    """Return the required DB env vars that are unset."""
+    return [k for k in REQUIRED_ENV_VARS if not os.getenv(k)]
+
+
 def _vars():
-    """Return required env vars or raise."""
-    keys = ("DB_HOST", "DB_USER", "DB_PASSWORD")
-    missing = [k for k in keys if not os.getenv(k)]
+    """Raise if required env vars are missing.
+
+    Only runs while the pool is being created; once it exists the settings
+    can't change, so requests don't re-check them.
+    """
+    missing = missing_env_vars()
     if missing:
         raise HTTPException(status_code=500,
                             detail=f"Missing env vars: {', '.join(missing)}")
 
-def _pool():
-    """Create a tiny connection pool to MySQL."""
-    return aiomysql.create_pool(
-        host=os.getenv("DB_HOST"),
-        port=int(os.getenv("DB_PORT", 3306)),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        db=(os.getenv("DB_NAME") or None),   # can be blank on fresh cluster
-        autocommit=True,
-        minsize=1,
-        maxsize=2,
+_db_pool: Optional[aiomysql.Pool] = None
+_db_pool_lock = asyncio.Lock()
+
+
+async def _pool() -> aiomysql.Pool:
+    """Return the shared MySQL connection pool, creating it on first use.
+
+    The pool lives for the whole process so requests reuse open connections
+    instead of paying the connect/auth handshake every time. Callers must not
+    close it; `close_pool()` is wired to app shutdown.
+    """
+    global _db_pool
+    if _db_pool is None:
+        async with _db_pool_lock:
+            if _db_pool is None:
+                _vars()
+                _db_pool = await aiomysql.create_pool(
+                    host=os.getenv("DB_HOST"),
+                    port=int(os.getenv("DB_PORT", 3306)),
+                    user=os.getenv("DB_USER"),
+                    password=os.getenv("DB_PASSWORD"),
+                    db=(os.getenv("DB_NAME") or None),   # can be blank on fresh cluster
+                    autocommit=True,
+                    # Keep DB_POOL_MAX x worker count below the server's max_connections
+                    minsize=int(os.getenv("DB_POOL_MIN", 5)),
+                    maxsize=int(os.getenv("DB_POOL_MAX", 25)),
+                    pool_recycle=1800,  # recycle before Aurora drops idle connections
+                )
+    return _db_pool
+
+
+async def close_pool() -> None:
+    """Close the shared MySQL connection pool if it was ever opened."""
+    global _db_pool
+    if _db_pool is not None:
+        _db_pool.close()
+        await _db_pool.wait_closed()
+        _db_pool = None
+    # A new pool may point at another database
+    _reset_test_table()
+
+
+# Set once test_table has been created through the current pool
+_test_table_ready = False
+
+# MySQL error code for a statement on a table that doesn't exist
+ER_NO_SUCH_TABLE = 1146
+
+TEST_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS test_table (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
+"""
+
+
+def _reset_test_table() -> None:
+    """Forget that test_table exists so the next write creates it again."""
+    global _test_table_ready
+    _test_table_ready = False
+
+# Table names seen by the last SHOW TABLES; used to whitelist `query_table`
+_known_tables: frozenset[str] = frozenset()
+
+
+async def _fetch_tables(conn) -> list[str]:
+    """Run SHOW TABLES and refresh the cached table whitelist."""
+    global _known_tables
+    async with conn.cursor() as cur:
+        await cur.execute("SHOW TABLES")
+        tables = [row[0] for row in await cur.fetchall()]
+    _known_tables = frozenset(tables)
+    return tables
+
+
+async def _stream_rows(table: str, limit: int) -> AsyncIterator[bytes]:
+    """Yield rows as NDJSON, reading them from an unbuffered server-side cursor."""
+    pool = await _pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.SSDictCursor) as cur:
+            await cur.execute(f"SELECT * FROM `{table}` LIMIT %s", (limit,))
+            while True:
+                rows = await cur.fetchmany(1000)
+                if not rows:
+                    break
+                yield b"".join(orjson.dumps(row, default=json_default) + b"\n" for row in rows)
 
 # -------------------------------------------------------------------------
 # Endpoints
@@ -37,65 +129,71 @@ def _pool():
 @router.get("/db-test/", tags=["db"])
 async def db_test():
     """Return server version + current timestamp."""
-    _vars()
     pool = await _pool()
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute("SELECT VERSION(), NOW()")
             version, now = await cur.fetchone()
-    pool.close(); await pool.wait_closed()
     return {"status": "ok", "server_version": version, "now": str(now)}
 
 @router.post("/db-test-write/", tags=["db"])
 async def db_test_write():
-    """Create table if needed and insert one row."""
-    _vars()
+    """Create table if needed (once per process) and insert one row."""
     pool = await _pool()
+    global _test_table_ready
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
-            await cur.execute("""
-                CREATE TABLE IF NOT EXISTS test_table (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            await cur.execute("INSERT INTO test_table () VALUES ()")
-            await cur.execute("SELECT LAST_INSERT_ID(), NOW()")
-            row_id, ts = await cur.fetchone()
-    pool.close(); await pool.wait_closed()
+            if not _test_table_ready:
+                await cur.execute(TEST_TABLE_DDL)
+                _test_table_ready = True
+            try:
+                await cur.execute("INSERT INTO test_table () VALUES ()")
+            except aiomysql.ProgrammingError as e:
+                if e.args[0] != ER_NO_SUCH_TABLE:
+                    raise
+                # Dropped since we created it; create it again and retry once
+                _reset_test_table()
+                await cur.execute(TEST_TABLE_DDL)
+                _test_table_ready = True
+                await cur.execute("INSERT INTO test_table () VALUES ()")
+            # The insert id arrives in the OK packet; only NOW() needs a query
+            row_id = cur.lastrowid
+            await cur.execute("SELECT NOW()")
+            (ts,) = await cur.fetchone()
     return {"status": "ok", "inserted_id": row_id, "timestamp": str(ts)}
 
-@router.get("/db-tables/", tags=["db"])
+@router.get("/db-tables/", response_model=None, tags=["db"])
 async def list_tables():
     """List all tables in the database."""
-    _vars()
     pool = await _pool()
     async with pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute("SHOW TABLES")
-            tables = [row[0] for row in await cur.fetchall()]
-    pool.close(); await pool.wait_closed()
-    return {"tables": tables}
-
-@router.get("/db-query/", tags=["db"])
-async def query_table(table: str, limit: int = 100):
-    """Query all data from a specific table with optional limit."""
-    _vars()
+        tables = await _fetch_tables(conn)
+    return ORJSONResponse({"tables": tables})
+
+@router.get("/db-query/", response_model=None, tags=["db"])
+async def query_table(table: str, limit: int = 100, stream: bool = False):
+    """Query all data from a specific table with optional limit.
+
+    With `stream=true` rows are returned as NDJSON while they are read, so
+    memory stays bounded for large limits.
+    """
     pool = await _pool()
     async with pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            # Get column info first
-            await cur.execute(f"DESCRIBE `{table}`")
-            columns = [row[0] for row in await cur.fetchall()]
-            
-            # Get data
+        # Only interpolate names that exist; refresh once in case the table is new
+        if table not in _known_tables:
+            await _fetch_tables(conn)
+            if table not in _known_tables:
+                raise HTTPException(status_code=404, detail=f"Table not found: {table}")
+
+        if stream:
+            return StreamingResponse(_stream_rows(table, limit), media_type="application/x-ndjson")
+
+        # DictCursor builds row dicts in the driver; column names come from the
+        # result description, so no separate DESCRIBE round-trip is needed
+        async with conn.cursor(aiomysql.DictCursor) as cur:
             await cur.execute(f"SELECT * FROM `{table}` LIMIT %s", (limit,))
-            rows = await cur.fetchall()
-    pool.close(); await pool.wait_closed()
-    
-    # Convert to list of dictionaries for easier frontend consumption
-    data = []
-    for row in rows:
-        data.append(dict(zip(columns, row)))
+            columns = [col[0] for col in cur.description]
+            data = list(await cur.fetchall())
     
-    return {"table": table, "columns": columns, "data": data, "count": len(data)} 
\ No newline at end of file
+    # Rows go straight to orjson, skipping FastAPI's jsonable_encoder pass
+    return ORJSONResponse({"table": table, "columns": columns, "data": data, "count": len(data)}) 
\ No newline at end of file
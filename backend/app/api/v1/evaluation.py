@@ -1,10 +1,11 @@
 """Evaluation endpoints for comparing ground truth data with extraction API results."""
 from __future__ import annotations
 
-import json
+import os
 import asyncio
 import time
-from typing import Dict, List, Optional, Any, Union
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel, Field
 
@@ -14,14 +15,17 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Import DB helpers
-from .db import _pool, _vars
+from .db import _pool
 
 # Import services
-from ...services.comparison_service import EvaluationMetrics, calculate_overall_metrics
-from ...services.storage_service import parse_s3_uri, get_file_hash_from_key, s3_client
+from ...services.comparison_service import EvaluationMetrics
+from ...services.storage_service import (
+    parse_s3_uri, get_file_hash_from_key, list_s3_objects, parse_json_bytes,
+    get_ground_truth_index
+)
 from ...services.evaluation_runner_service import (
-    generate_evaluation_run_id, run_evaluation_task, evaluation_lock,
-    seed_ground_truth_from_extraction
+    generate_evaluation_run_id, run_evaluation_task, evaluation_semaphore,
+    seed_ground_truth_from_extraction, EXTRACTION_CONCURRENCY
 )
 from ...services.history_service import (
     load_evaluation_from_s3, check_missing_ground_truth, list_source_files
@@ -93,8 +97,35 @@ class EvaluationResult(BaseModel):
     completed_iterations: int
     errors: List[str]
 
-# In-memory storage for evaluation results (replace with database in production)
-evaluation_store: Dict[str, EvaluationResult] = {}
+class EvaluationStore(OrderedDict):
+    """
+    In-memory evaluation results bounded to the `max_size` most recently used entries.
+    Queued and running evaluations are never evicted, so background tasks can always
+    find their result object.
+    """
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        excess = len(self) - self.max_size
+        if excess > 0:
+            finished = [k for k, v in self.items() if v.status not in ("queued", "running")]
+            for stale_key in finished[:excess]:
+                del self[stale_key]
+
+
+# In-memory storage for evaluation results (replace with database in production).
+# Full runs are persisted to S3 when responses_uri is set and can be reloaded from history.
+evaluation_store: Dict[str, EvaluationResult] = EvaluationStore(int(os.getenv("EVALUATION_STORE_MAX", 128)))
 
 # -------------------------------------------------------------------------
 # Route Handlers
@@ -107,10 +138,10 @@ async def run_evaluation(request: EvaluationRequest, background_tasks: Backgroun
     # Generate evaluation run ID upfront (this will be used consistently)
     evaluation_run_id = generate_evaluation_run_id()
     
-    # Check if evaluation lock is currently held
-    lock_acquired = evaluation_lock.locked()
+    # Check whether every evaluation slot is currently taken
+    lock_acquired = evaluation_semaphore.locked()
     if lock_acquired:
-        logger.info(f"Evaluation {evaluation_run_id} queued - another evaluation is currently running")
+        logger.info(f"Evaluation {evaluation_run_id} queued - the maximum number of evaluations is running")
     else:
         logger.info(f"Evaluation {evaluation_run_id} starting - no queue")
     
@@ -152,7 +183,7 @@ async def run_evaluation(request: EvaluationRequest, background_tasks: Backgroun
     return {
         "evaluation_id": evaluation_run_id, 
         "status": "queued" if lock_acquired else "started",
-        "message": "Evaluation queued - another evaluation is running" if lock_acquired else "Evaluation started"
+        "message": "Evaluation queued - the maximum number of evaluations is running" if lock_acquired else "Evaluation started"
     }
 
 @router.post("/test-progress/", tags=["debug"])
@@ -226,7 +257,8 @@ async def debug_evaluation_store():
 async def get_evaluation_status():
     """Get the current status of the evaluation system (running/queue info)."""
     
-    lock_held = evaluation_lock.locked()
+    # Reported as lock_held for existing clients: true when no evaluation slot is free
+    lock_held = evaluation_semaphore.locked()
     running_evaluations = []
     queued_evaluations = []
     
@@ -279,7 +311,6 @@ async def list_evaluations():
 async def get_evaluation_metrics(limit: int = 100):
     """Get evaluation metrics from database for dashboard."""
     try:
-        _vars()
         pool = await _pool()
         async with pool.acquire() as conn:
             async with conn.cursor() as cur:
@@ -325,10 +356,9 @@ async def get_evaluation_metrics(limit: int = 100):
                         "overall_fn": row[10],
                         "ground_truth_file_id": row[11],
                         "extraction_run_id": row[12],
-                        "evaluation_config": json.loads(row[13]) if row[13] else {}
+                        "evaluation_config": parse_json_bytes(row[13]) if row[13] else {}
                     })
         
-        pool.close(); await pool.wait_closed()
         return {"metrics": metrics, "count": len(metrics)}
         
     except Exception as e:
@@ -349,14 +379,13 @@ async def seed_ground_truth(request: SeedGroundTruthRequest):
         source_bucket, source_prefix = parse_s3_uri(request.source_data_uri)
         gt_bucket, gt_prefix = parse_s3_uri(request.ground_truth_uri)
         
-        # List source files
-        source_response = s3_client.list_objects_v2(Bucket=source_bucket, Prefix=source_prefix)
-        source_files = [obj['Key'] for obj in source_response.get('Contents', []) if obj['Key'].endswith('.pdf')]
-        
-        # List existing ground truth files
-        gt_response = s3_client.list_objects_v2(Bucket=gt_bucket, Prefix=gt_prefix)
-        existing_gt_files = {get_file_hash_from_key(obj['Key']): obj['Key'] 
-                           for obj in gt_response.get('Contents', []) if obj['Key'].endswith('.json')}
+        # List source files and existing ground truth files off the event loop, in parallel
+        # The ground truth listing is always refreshed here so a stale index can't overwrite existing files
+        source_objects, existing_gt_files = await asyncio.gather(
+            asyncio.to_thread(list_s3_objects, source_bucket, source_prefix),
+            asyncio.to_thread(get_ground_truth_index, gt_bucket, gt_prefix, True)
+        )
+        source_files = [obj['Key'] for obj in source_objects if obj['Key'].endswith('.pdf')]
         
         seeded_files = []
         skipped_files = []
@@ -364,34 +393,51 @@ async def seed_ground_truth(request: SeedGroundTruthRequest):
         
         from ...services.storage_service import fetch_s3_file_content
         
+        # Decide what to seed up front so tasks are only spawned for files that need work
+        to_seed = []
         for source_key in source_files:
-            try:
-                file_hash = get_file_hash_from_key(source_key)
-                filename = source_key.split('/')[-1]
-                
-                # If user specified a specific file hash, only process that one
-                if request.file_hash and file_hash != request.file_hash:
-                    continue
-                
-                # Check if ground truth already exists
-                if file_hash in existing_gt_files:
-                    skipped_files.append(f"{filename} (ground truth already exists)")
-                    continue
-                
-                # Fetch PDF content
-                pdf_content = await fetch_s3_file_content(source_bucket, source_key)
-                
-                # Seed ground truth from extraction API
-                gt_extracted_data = await seed_ground_truth_from_extraction(
-                    pdf_content, filename, file_hash, 
-                    request.extraction_endpoint, request.extraction_types,
-                    request.oauth_token, request.ground_truth_uri
-                )
-                
+            file_hash = get_file_hash_from_key(source_key)
+            filename = source_key.split('/')[-1]
+            
+            # If user specified a specific file hash, only process that one
+            if request.file_hash and file_hash != request.file_hash:
+                continue
+            
+            # Check if ground truth already exists
+            if file_hash in existing_gt_files:
+                skipped_files.append(f"{filename} (ground truth already exists)")
+                continue
+            
+            to_seed.append((source_key, filename, file_hash))
+        
+        # Each seed is an S3 fetch plus a full extraction; run them concurrently, bounded
+        # like the evaluation runner's extraction calls
+        seed_semaphore = asyncio.Semaphore(EXTRACTION_CONCURRENCY)
+        
+        async def seed_one(source_key: str, filename: str, file_hash: str) -> Optional[str]:
+            """Seed one file; returns an error message, or None on success."""
+            async with seed_semaphore:
+                try:
+                    # Fetch PDF content
+                    pdf_content = await fetch_s3_file_content(source_bucket, source_key)
+                    
+                    # Seed ground truth from extraction API
+                    await seed_ground_truth_from_extraction(
+                        pdf_content, filename, file_hash, 
+                        request.extraction_endpoint, request.extraction_types,
+                        request.oauth_token, request.ground_truth_uri
+                    )
+                    return None
+                    
+                except Exception as e:
+                    return f"Failed to seed {source_key}: {str(e)}"
+        
+        seed_errors = await asyncio.gather(*(seed_one(*job) for job in to_seed))
+        for (source_key, filename, file_hash), error in zip(to_seed, seed_errors):
+            if error is None:
                 seeded_files.append(f"{filename} -> {file_hash}.json")
-                
-            except Exception as e:
-                errors.append(f"Failed to seed {source_key}: {str(e)}")
+            else:
+                errors.append(error)
         
         return SeedGroundTruthResult(
             seeded_files=seeded_files,
@@ -424,132 +470,152 @@ async def recalculate_evaluation(evaluation_id: str, request: RecalculateRequest
         # Parse ground truth S3 URI
         gt_bucket, gt_prefix = parse_s3_uri(request.ground_truth_uri)
         
-        # List ground truth files from S3
-        gt_response = s3_client.list_objects_v2(Bucket=gt_bucket, Prefix=gt_prefix)
-        gt_files = {get_file_hash_from_key(obj['Key']): obj['Key'] 
-                   for obj in gt_response.get('Contents', []) if obj['Key'].endswith('.json')}
+        # List ground truth files from S3 (listing is cached briefly; file contents are always fresh)
+        gt_files = await asyncio.to_thread(get_ground_truth_index, gt_bucket, gt_prefix)
         
         # Recalculate scores and metrics for each document
         updated_documents = []
-        all_scores = []
-        all_true_negatives = []
         
         # Cache for reloaded ground truth data
         gt_cache = {}
         
-        from ...services.storage_service import fetch_s3_file_content
+        # file_hash -> (filtered ground truth, flattened, normalized) under this request's filters
+        prepared_gt_cache: Dict[str, Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]] = {}
+        
+        # Responses that already hold only the requested types skip the API-side filter
+        extraction_type_set = set(request.extraction_types or [])
+        
+        from ...services.storage_service import fetch_s3_json
         from ...services.comparison_service import (
             filter_ground_truth_by_extraction_types, remove_excluded_fields_from_ground_truth,
-            compare_extraction_results, calculate_overall_metrics
+            compare_iteration_results, MetricsAccumulator, flatten_and_normalize
         )
+        metrics_accumulator = MetricsAccumulator(track_fields=False)
         
+        # Reload every needed ground truth file from S3 up front, concurrently
+        needed_gt = {}
         for doc_eval in result.documents:
-            if doc_eval.api_responses:
-                # Reload ground truth data from S3
-                ground_truth_data = None
-                if doc_eval.file_hash and doc_eval.file_hash in gt_files:
-                    if doc_eval.file_hash not in gt_cache:
-                        try:
-                            # Fetch fresh ground truth from S3
-                            gt_content = await fetch_s3_file_content(gt_bucket, gt_files[doc_eval.file_hash])
-                            ground_truth = json.loads(gt_content.decode('utf-8'))
-                            # Extract only the extracted_data part for comparison
-                            gt_cache[doc_eval.file_hash] = ground_truth.get('extracted_data', ground_truth)
-                        except Exception as e:
-                            print(f"Failed to reload ground truth for {doc_eval.filename}: {str(e)}")
-                            gt_cache[doc_eval.file_hash] = None
-                
-                ground_truth_data = gt_cache.get(doc_eval.file_hash)
-                
-                if ground_truth_data:
-                    # Filter ground truth based on extraction types if provided
-                    if request.extraction_types:
-                        filtered_ground_truth = filter_ground_truth_by_extraction_types(ground_truth_data, request.extraction_types)
-                    else:
-                        filtered_ground_truth = ground_truth_data
-                    
-                    # Remove excluded fields from ground truth if provided
-                    if request.excluded_fields is not None:
-                        filtered_ground_truth = remove_excluded_fields_from_ground_truth(filtered_ground_truth, request.excluded_fields)
-                    
-                    # Calculate scores for each iteration
-                    iteration_scores = []
-                    iteration_mismatches = []
-                    iteration_true_negatives: List[int] = []
-                    scores = {}
-                    mismatches = []
-                    true_negatives = 0
+            if doc_eval.api_responses and doc_eval.file_hash and doc_eval.file_hash in gt_files:
+                needed_gt.setdefault(doc_eval.file_hash, doc_eval.filename)
+        
+        async def load_ground_truth(file_hash: str, filename: str):
+            try:
+                # Fetch fresh ground truth from S3
+                ground_truth = await fetch_s3_json(gt_bucket, gt_files[file_hash])
+                # Extract only the extracted_data part for comparison
+                return ground_truth.get('extracted_data', ground_truth)
+            except Exception as e:
+                print(f"Failed to reload ground truth for {filename}: {str(e)}")
+                return None
+        
+        loaded_gt = await asyncio.gather(*(
+            load_ground_truth(file_hash, filename) for file_hash, filename in needed_gt.items()
+        ))
+        gt_cache.update(zip(needed_gt, loaded_gt))
+        
+        def rescore_documents() -> None:
+            """Score every document against its reloaded ground truth; pure CPU work, run in a worker thread."""
+            for doc_eval in result.documents:
+                if doc_eval.api_responses:
+                    ground_truth_data = gt_cache.get(doc_eval.file_hash)
                     
-                    for idx, api_response in enumerate(doc_eval.api_responses):
-                        # Also apply exclusions to API response for fair comparison
-                        if request.excluded_fields is not None:
-                            api_extracted_data = api_response.get("extracted_data", api_response)
+                    if ground_truth_data:
+                        # The filters are fixed for this request, so documents sharing a file hash reuse the prepared ground truth
+                        if doc_eval.file_hash not in prepared_gt_cache:
+                            # Filter ground truth based on extraction types if provided
                             if request.extraction_types:
-                                filtered_api_extracted_data = filter_ground_truth_by_extraction_types(
-                                    api_extracted_data, request.extraction_types
+                                filtered_ground_truth = filter_ground_truth_by_extraction_types(ground_truth_data, request.extraction_types)
+                            else:
+                                filtered_ground_truth = ground_truth_data
+                            
+                            # Remove excluded fields from ground truth if provided
+                            if request.excluded_fields:
+                                filtered_ground_truth = remove_excluded_fields_from_ground_truth(filtered_ground_truth, request.excluded_fields)
+                            
+                            # Flatten and normalize the ground truth once; it is the same for every iteration
+                            gt_flat, gt_norm = flatten_and_normalize(filtered_ground_truth)
+                            prepared_gt_cache[doc_eval.file_hash] = (filtered_ground_truth, gt_flat, gt_norm)
+                        
+                        filtered_ground_truth, gt_flat, gt_norm = prepared_gt_cache[doc_eval.file_hash]
+                        
+                        # Calculate scores for each iteration
+                        iteration_scores = []
+                        iteration_mismatches = []
+                        scores = {}
+                        mismatches = []
+                        true_negatives = 0
+                        
+                        compared_responses = []
+                        for api_response in doc_eval.api_responses:
+                            # Also apply exclusions to API response for fair comparison
+                            if request.excluded_fields is not None:
+                                api_extracted_data = api_response.get("extracted_data", api_response)
+                                if request.extraction_types and not extraction_type_set.issuperset(api_extracted_data.keys()):
+                                    filtered_api_extracted_data = filter_ground_truth_by_extraction_types(
+                                        api_extracted_data, request.extraction_types
+                                    )
+                                else:
+                                    filtered_api_extracted_data = api_extracted_data
+                                filtered_api_extracted_data = remove_excluded_fields_from_ground_truth(
+                                    filtered_api_extracted_data, request.excluded_fields
                                 )
+                                compared_responses.append({"extracted_data": filtered_api_extracted_data})
                             else:
-                                filtered_api_extracted_data = api_extracted_data
-                            filtered_api_extracted_data = remove_excluded_fields_from_ground_truth(
-                                filtered_api_extracted_data, request.excluded_fields
-                            )
-                            filtered_api_response = {"extracted_data": filtered_api_extracted_data}
-                            iter_scores, iter_mismatches, iter_true_negatives = compare_extraction_results(filtered_ground_truth, filtered_api_response)
-                        else:
-                            iter_scores, iter_mismatches, iter_true_negatives = compare_extraction_results(filtered_ground_truth, api_response)
-                        # Add iteration info to mismatches
-                        iter_mismatches = [f"[{doc_eval.filename} | Iter {idx + 1}] {mismatch}" for mismatch in iter_mismatches]
+                                compared_responses.append(api_response)
                         
-                        iteration_scores.append(iter_scores)
-                        iteration_mismatches.append(iter_mismatches)
-                        iteration_true_negatives.append(iter_true_negatives)
+                        # Identical responses across iterations are only compared once
+                        results = compare_iteration_results(filtered_ground_truth, compared_responses, gt_flat, gt_norm)
+                        for idx, (iter_scores, iter_mismatches, iter_true_negatives) in enumerate(results):
+                            # Add iteration info to mismatches
+                            prefix = f"[{doc_eval.filename} | Iter {idx + 1}] "
+                            iter_mismatches = [prefix + mismatch for mismatch in iter_mismatches]
+                            
+                            iteration_scores.append(iter_scores)
+                            iteration_mismatches.append(iter_mismatches)
+                            
+                            # Use the last iteration for the main scores (backward compatibility)
+                            if idx == len(doc_eval.api_responses) - 1:
+                                scores = iter_scores
+                                mismatches = iter_mismatches
+                                true_negatives = iter_true_negatives
                         
-                        # Use the last iteration for the main scores (backward compatibility)
-                        if idx == len(doc_eval.api_responses) - 1:
-                            scores = iter_scores
-                            mismatches = iter_mismatches
-                            true_negatives = iter_true_negatives
-                    
-                    # Update document evaluation with new calculations and reloaded ground truth
-                    updated_doc = DocumentEvaluation(
-                        filename=doc_eval.filename,
-                        file_hash=doc_eval.file_hash,
-                        ground_truth=filtered_ground_truth,  # Use filtered ground truth
-                        api_responses=doc_eval.api_responses,  # Keep original responses
-                        scores=scores,
-                        mismatches=mismatches,
-                        true_negatives=true_negatives,
-                        iteration_scores=iteration_scores,
-                        iteration_mismatches=iteration_mismatches
-                    )
-                    updated_documents.append(updated_doc)
-                    
-                    if iteration_scores:
-                        all_scores.extend(iteration_scores)
-                        all_true_negatives.extend(iteration_true_negatives)
+                        # Update document evaluation with new calculations and reloaded ground truth
+                        updated_doc = DocumentEvaluation(
+                            filename=doc_eval.filename,
+                            file_hash=doc_eval.file_hash,
+                            ground_truth=filtered_ground_truth,  # Use filtered ground truth
+                            api_responses=doc_eval.api_responses,  # Keep original responses
+                            scores=scores,
+                            mismatches=mismatches,
+                            true_negatives=true_negatives,
+                            iteration_scores=iteration_scores,
+                            iteration_mismatches=iteration_mismatches
+                        )
+                        updated_documents.append(updated_doc)
+                        
+                        for iteration_score in iteration_scores or [scores]:
+                            metrics_accumulator.add(iteration_score)
                     else:
-                        all_scores.append(scores)
-                        all_true_negatives.append(true_negatives)
+                        # No ground truth available
+                        updated_doc = DocumentEvaluation(
+                            filename=doc_eval.filename,
+                            file_hash=doc_eval.file_hash,
+                            ground_truth=None,
+                            api_responses=doc_eval.api_responses,
+                            scores={},
+                            mismatches=[],
+                            true_negatives=0
+                        )
+                        updated_documents.append(updated_doc)
                 else:
-                    # No ground truth available
-                    updated_doc = DocumentEvaluation(
-                        filename=doc_eval.filename,
-                        file_hash=doc_eval.file_hash,
-                        ground_truth=None,
-                        api_responses=doc_eval.api_responses,
-                        scores={},
-                        mismatches=[],
-                        true_negatives=0
-                    )
-                    updated_documents.append(updated_doc)
-                    all_true_negatives.append(0)
-            else:
-                # Keep documents without API responses unchanged
-                updated_documents.append(doc_eval)
-                all_true_negatives.append(doc_eval.true_negatives)
+                    # Keep documents without API responses unchanged
+                    updated_documents.append(doc_eval)
+        
+        # Keep the event loop free for other requests while documents are rescored
+        await asyncio.to_thread(rescore_documents)
         
         # Recalculate overall metrics
-        new_metrics = calculate_overall_metrics(all_scores)
+        new_metrics = metrics_accumulator.overall_metrics()
         
         # Update the stored result
         result.documents = updated_documents
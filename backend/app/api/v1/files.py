@@ -1,6 +1,7 @@
 """File management endpoints for document extraction evaluation."""
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import os
 import uuid
@@ -8,41 +9,23 @@ import logging
 from typing import Optional
 from urllib.parse import urlparse
 
-import aiomysql
-import boto3
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, Body
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import io
-import json
 import traceback
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+# Reuse the shared connection pool from db.py
+from .db import _pool
+from ...services.storage_service import invalidate_ground_truth_index, dump_json_bytes, s3_client
 
-# Use same DB connection helper as db.py
-def _ensure_vars() -> None:
-    missing = [k for k in ("DB_HOST", "DB_USER", "DB_PASSWORD") if not os.getenv(k)]
-    if missing:
-        raise HTTPException(status_code=500, detail=f"Missing env vars: {', '.join(missing)}")
-
-def _pool():
-    return aiomysql.create_pool(
-        host=os.getenv("DB_HOST"),
-        port=int(os.getenv("DB_PORT", 3306)),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        db=(os.getenv("DB_NAME") or None),
-        autocommit=True,
-        minsize=1,
-        maxsize=2,
-    )
+router = APIRouter()
 
-# S3 client for file storage
-s3_client = boto3.client("s3")
+# S3 client for file storage is the shared pooled client; calls run via asyncio.to_thread
 S3_BUCKET = os.getenv("S3_BUCKET", "default-bucket")  # Configure in env
 
 
@@ -61,8 +44,6 @@ async def upload_pdf(file: UploadFile = File(...)):
     if not file.filename or not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    _ensure_vars()
-    
     # Read file content and compute hash
     content = await file.read()
     file_hash = hashlib.sha256(content).hexdigest()
@@ -81,7 +62,7 @@ async def upload_pdf(file: UploadFile = File(...)):
                 # File exists in database - check if it actually exists in S3
                 existing_s3_key = existing[2]
                 try:
-                    s3_client.head_object(Bucket=S3_BUCKET, Key=existing_s3_key)
+                    await asyncio.to_thread(s3_client.head_object, Bucket=S3_BUCKET, Key=existing_s3_key)
                     logger.info(f"File exists in both database and S3 - File ID: {existing[0]}")
                     # File exists in both DB and S3 - return existing record
                     return FileResponse(
@@ -97,7 +78,8 @@ async def upload_pdf(file: UploadFile = File(...)):
                     logger.warning(f"File exists in database but not in S3 - re-uploading. File ID: {existing[0]}, S3 Key: {existing_s3_key}")
                     try:
                         from urllib.parse import quote_plus
-                        s3_client.put_object(
+                        await asyncio.to_thread(
+                            s3_client.put_object,
                             Bucket=S3_BUCKET,
                             Key=existing_s3_key,
                             Body=content,
@@ -128,7 +110,8 @@ async def upload_pdf(file: UploadFile = File(...)):
             # Upload to S3
             try:
                 from urllib.parse import quote_plus
-                s3_client.put_object(
+                await asyncio.to_thread(
+                    s3_client.put_object,
                     Bucket=S3_BUCKET,
                     Key=s3_key,
                     Body=content,
@@ -153,8 +136,6 @@ async def upload_pdf(file: UploadFile = File(...)):
             
             logger.info(f"File successfully uploaded and stored - File ID: {file_id}")
     
-    pool.close(); await pool.wait_closed()
-    
     return FileResponse(
         file_id=file_id,
         file_hash=file_hash,
@@ -173,8 +154,6 @@ async def upload_any_file(file: UploadFile = File(...), target_uri: str | None =
     if not file.filename:
         raise HTTPException(status_code=400, detail="File must have a name")
 
-    _ensure_vars()
-
     # Read bytes and compute hash
     content = await file.read()
     file_hash = hashlib.sha256(content).hexdigest()
@@ -207,7 +186,7 @@ async def upload_any_file(file: UploadFile = File(...), target_uri: str | None =
                 # File exists in database - check if it actually exists in S3
                 existing_s3_key = existing[2]
                 try:
-                    s3_client.head_object(Bucket=bucket_override, Key=existing_s3_key)
+                    await asyncio.to_thread(s3_client.head_object, Bucket=bucket_override, Key=existing_s3_key)
                     logger.info(f"File exists in both database and S3 - File ID: {existing[0]}, Original name: {existing[1]}")
                     return FileResponse(
                         file_id=existing[0],
@@ -222,7 +201,8 @@ async def upload_any_file(file: UploadFile = File(...), target_uri: str | None =
                     logger.warning(f"File exists in database but not in S3 - re-uploading. File ID: {existing[0]}, S3 Key: {existing_s3_key}")
                     try:
                         from urllib.parse import quote_plus
-                        s3_client.put_object(
+                        await asyncio.to_thread(
+                            s3_client.put_object,
                             Bucket=bucket_override,
                             Key=existing_s3_key,
                             Body=content,
@@ -249,7 +229,8 @@ async def upload_any_file(file: UploadFile = File(...), target_uri: str | None =
 
             try:
                 from urllib.parse import quote_plus
-                s3_client.put_object(
+                await asyncio.to_thread(
+                    s3_client.put_object,
                     Bucket=bucket_override,
                     Key=s3_key,
                     Body=content,
@@ -272,8 +253,6 @@ async def upload_any_file(file: UploadFile = File(...), target_uri: str | None =
 
             logger.info(f"File successfully uploaded and stored - File ID: {file_id}")
 
-    pool.close(); await pool.wait_closed()
-
     return FileResponse(
         file_id=file_id,
         file_hash=file_hash,
@@ -302,12 +281,14 @@ async def save_ground_truth(
     key = f'{prefix}{filename}'
     try:
         print(f"Uploading ground truth to {bucket}/{key}")
-        s3_client.put_object(
+        await asyncio.to_thread(
+            s3_client.put_object,
             Bucket=bucket,
             Key=key,
-            Body=json.dumps(content),
+            Body=dump_json_bytes(content),
             ContentType='application/json'
         )
+        invalidate_ground_truth_index(bucket)
         print("Save successful")
         return {'status': 'ok'}
     except Exception as e:
@@ -319,7 +300,6 @@ async def save_ground_truth(
 @router.get("/files/", tags=["files"])
 async def list_files(limit: int = 50):
     """List all uploaded files with basic metadata."""
-    _ensure_vars()
     pool = await _pool()
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
@@ -330,8 +310,6 @@ async def list_files(limit: int = 50):
             )
             rows = await cur.fetchall()
     
-    pool.close(); await pool.wait_closed()
-    
     files = []
     for row in rows:
         files.append({
@@ -348,7 +326,6 @@ async def list_files(limit: int = 50):
 @router.get("/files/{file_id}", tags=["files"])
 async def get_file_details(file_id: str):
     """Get detailed information about a specific file including related data."""
-    _ensure_vars()
     pool = await _pool()
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
@@ -370,8 +347,6 @@ async def get_file_details(file_id: str):
             await cur.execute("SELECT COUNT(*) FROM extraction_runs WHERE file_id = %s", (file_id,))
             runs_count = (await cur.fetchone())[0]
     
-    pool.close(); await pool.wait_closed()
-    
     return {
         "file_id": file_row[0],
         "file_hash": file_row[1],
@@ -399,7 +374,7 @@ async def proxy_pdf(uri: str = Query(..., description="S3 URI to proxy")):
             raise HTTPException(status_code=400, detail="Invalid S3 URI format")
         
         # Get the object from S3
-        response = s3_client.get_object(Bucket=bucket, Key=key)
+        response = await asyncio.to_thread(s3_client.get_object, Bucket=bucket, Key=key)
         
         # Stream the content
         def generate():
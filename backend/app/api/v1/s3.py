@@ -5,15 +5,18 @@ Assumes AWS credentials are provided via environment variables or IAM role.
 # noqa: D401
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
-import boto3
 from botocore.exceptions import NoCredentialsError
+import asyncio
 import os
 from typing import Optional
 from pathlib import Path
+from urllib.parse import unquote_plus
 
 
 from pydantic import BaseModel
-import json
+
+from ...services.storage_service import dump_json_bytes, invalidate_ground_truth_index, s3_client
+from ...services.evaluation_runner_service import TAGGING_CONCURRENCY
 
 class GroundTruthUpload(BaseModel):
     bucket: str
@@ -23,8 +26,7 @@ class GroundTruthUpload(BaseModel):
 
 router = APIRouter()
 
-# Use default credential chain (env vars, shared config, IAM role, etc.)
-s3_client = boto3.client("s3")
+# s3_client is the shared pooled client (default credential chain: env vars, shared config, IAM role, etc.)
 
 
 @router.get("/list-files/", tags=["s3"])
@@ -34,7 +36,7 @@ async def list_files(bucket: str, prefix: Optional[str] = None):
     if prefix:
         params["Prefix"] = prefix
     try:
-        response = s3_client.list_objects_v2(**params)
+        response = await asyncio.to_thread(s3_client.list_objects_v2, **params)
     except s3_client.exceptions.NoSuchBucket:  # type: ignore  # boto3 dynamic attr
         raise HTTPException(status_code=404, detail="Bucket not found")
     except NoCredentialsError:
@@ -45,26 +47,28 @@ async def list_files(bucket: str, prefix: Optional[str] = None):
 
     keys = [obj["Key"] for obj in response.get("Contents", []) if not obj["Key"].endswith("/")]
 
-    # Enrich with original_name from S3 object tags
-    file_meta: list[dict] = []
-    for key in keys:
-        try:
-            # Get object tags to extract original_name
-            tag_response = s3_client.get_object_tagging(Bucket=bucket, Key=key)
-            original_name = None
-            
-            # Look for original_name in tags
-            for tag in tag_response.get("TagSet", []):
-                if tag["Key"] == "original_name":
-                    from urllib.parse import unquote_plus
-                    original_name = unquote_plus(tag["Value"])
-                    break
-            
-            file_meta.append({"key": key, "original_name": original_name})
-        except Exception as e:
-            # If we can't get tags (e.g., object doesn't exist or no permissions), 
-            # just include the key without original_name
-            file_meta.append({"key": key, "original_name": None})
+    # Enrich with original_name from S3 object tags; the lookups are independent round
+    # trips, so they run concurrently (bounded) off the event loop
+    semaphore = asyncio.Semaphore(TAGGING_CONCURRENCY)
+
+    async def describe(key: str) -> dict:
+        async with semaphore:
+            try:
+                # Get object tags to extract original_name
+                tag_response = await asyncio.to_thread(s3_client.get_object_tagging, Bucket=bucket, Key=key)
+            except Exception:
+                # If we can't get tags (e.g., object doesn't exist or no permissions),
+                # just include the key without original_name
+                return {"key": key, "original_name": None}
+        
+        # Look for original_name in tags
+        for tag in tag_response.get("TagSet", []):
+            if tag["Key"] == "original_name":
+                return {"key": key, "original_name": unquote_plus(tag["Value"])}
+        return {"key": key, "original_name": None}
+
+    # gather keeps the listing order
+    file_meta: list[dict] = await asyncio.gather(*(describe(key) for key in keys))
 
     return {"files": file_meta}
 
@@ -73,7 +77,7 @@ async def list_files(bucket: str, prefix: Optional[str] = None):
 async def download_file(bucket: str, key: str):
     """Stream an object from S3 back to the client."""
     try:
-        obj = s3_client.get_object(Bucket=bucket, Key=key)
+        obj = await asyncio.to_thread(s3_client.get_object, Bucket=bucket, Key=key)
     except s3_client.exceptions.NoSuchKey:  # type: ignore
         raise HTTPException(status_code=404, detail="File not found")
     except NoCredentialsError:
@@ -96,12 +100,14 @@ async def upload_ground_truth(payload: GroundTruthUpload):
     """Upload ground-truth JSON to S3 at the exact *key* provided (no hashing/prefix logic)."""
     try:
         print(f"Uploading ground truth to {payload.bucket}/{payload.key}")
-        s3_client.put_object(
+        await asyncio.to_thread(
+            s3_client.put_object,
             Bucket=payload.bucket,
             Key=payload.key,
-            Body=json.dumps(payload.content).encode("utf-8"),
+            Body=dump_json_bytes(payload.content),
             ContentType="application/json",
         )
+        invalidate_ground_truth_index(payload.bucket)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload ground truth: {e}")
 
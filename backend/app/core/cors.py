@@ -0,0 +1,170 @@
+"""Pure-ASGI CORS middleware with response headers precomputed at startup."""
+from typing import Iterable, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+ALL_METHODS = ("DELETE", "GET", "HEAD", "OPTIONS", "PATCH", "POST", "PUT")
+SAFELISTED_HEADERS = ("Accept", "Accept-Language", "Content-Language", "Content-Type")
+
+# Preflight answers depend on all of these request headers, so caches must key on them
+PREFLIGHT_VARY = (
+    b"Origin, Access-Control-Request-Method, Access-Control-Request-Headers, "
+    b"Access-Control-Request-Private-Network"
+)
+
+
+class FastCORSMiddleware:
+    """Drop-in for Starlette's `CORSMiddleware` covering the options this app uses.
+
+    All static header values (joined method/header lists, credentials, max-age,
+    Vary) are encoded once in `__init__`; per request only the origin is checked
+    and echoed back. Responses carry the same headers Starlette would send,
+    including `Vary: Origin` on every non-preflight response.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        allow_origins: Iterable[str] = (),
+        allow_methods: Iterable[str] = ("GET",),
+        allow_headers: Iterable[str] = (),
+        allow_credentials: bool = False,
+        max_age: int = 600,
+    ) -> None:
+        self.app = app
+
+        origins = list(allow_origins)
+        methods = list(ALL_METHODS) if "*" in allow_methods else list(allow_methods)
+        headers = list(allow_headers)
+
+        self.allow_all_origins = "*" in origins
+        self.allow_origins = frozenset(o.encode("latin-1") for o in origins)
+        self.allow_methods = frozenset(m.encode("latin-1") for m in methods)
+        self.allow_all_headers = "*" in headers
+        # Advertised as configured; matched case-insensitively
+        allowed_headers = sorted(set(SAFELISTED_HEADERS) | set(headers))
+        self.allow_headers = frozenset(h.lower().encode("latin-1") for h in allowed_headers)
+        # Wildcard origins can only be answered with a literal "*" when no credentials are involved
+        self.echo_origin = not self.allow_all_origins or allow_credentials
+
+        credentials: List[Tuple[bytes, bytes]] = []
+        if allow_credentials:
+            credentials.append((b"access-control-allow-credentials", b"true"))
+
+        # Simple responses: headers added whenever the request has an Origin, before the
+        # allowed origin (if any) is echoed back
+        self._simple_headers = list(credentials)
+        if self.allow_all_origins:
+            self._simple_headers.insert(0, (b"access-control-allow-origin", b"*"))
+
+        self._preflight_headers = [(b"vary", PREFLIGHT_VARY)]
+        if not self.echo_origin:
+            self._preflight_headers.append((b"access-control-allow-origin", b"*"))
+        self._preflight_headers += [
+            (b"access-control-allow-methods", ", ".join(methods).encode("latin-1")),
+            (b"access-control-max-age", str(max_age).encode("latin-1")),
+        ]
+        if not self.allow_all_headers:
+            self._preflight_headers.append(
+                (b"access-control-allow-headers", ", ".join(allowed_headers).encode("latin-1"))
+            )
+        self._preflight_headers += credentials
+
+    def _origin_allowed(self, origin: bytes) -> bool:
+        return self.allow_all_origins or origin in self.allow_origins
+
+    def _simple_extra(self, origin: Optional[bytes]) -> List[Tuple[bytes, bytes]]:
+        """CORS headers (other than Vary) for a non-preflight response."""
+        if origin is None:
+            return []
+        if self.echo_origin and self._origin_allowed(origin):
+            return [
+                *(h for h in self._simple_headers if h[0] != b"access-control-allow-origin"),
+                (b"access-control-allow-origin", origin),
+            ]
+        return self._simple_headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = request_method = request_headers = private_network = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+            elif name == b"access-control-request-private-network":
+                private_network = value
+
+        if origin is not None and scope["method"] == "OPTIONS" and request_method is not None:
+            await self._preflight(origin, request_method, request_headers, private_network, send)
+            return
+
+        extra = self._simple_extra(origin)
+        replaced = frozenset(name for name, _ in extra)
+
+        async def send_with_cors(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # Endpoint-set values of the headers we add are replaced, and any existing
+                # Vary values are merged with Origin into a single header
+                headers = []
+                vary = []
+                for name, value in message.get("headers", []):
+                    lower = name.lower()
+                    if lower == b"vary":
+                        vary.append(value)
+                    elif lower not in replaced:
+                        headers.append((name, value))
+                vary.append(b"Origin")
+                headers += extra
+                headers.append((b"vary", b", ".join(vary)))
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+    async def _preflight(
+        self,
+        origin: bytes,
+        request_method: bytes,
+        request_headers: Optional[bytes],
+        private_network: Optional[bytes],
+        send: Send,
+    ) -> None:
+        headers = list(self._preflight_headers)
+        failures = []
+        if self._origin_allowed(origin):
+            if self.echo_origin:
+                headers.append((b"access-control-allow-origin", origin))
+        else:
+            failures.append("origin")
+        if request_method not in self.allow_methods:
+            failures.append("method")
+
+        if self.allow_all_headers:
+            if request_headers is not None:
+                headers.append((b"access-control-allow-headers", request_headers))
+        elif request_headers is not None:
+            requested = {h.strip() for h in request_headers.lower().split(b",")}
+            if not requested <= self.allow_headers:
+                failures.append("headers")
+
+        # Private network access is never granted
+        if private_network is not None:
+            failures.append("private-network")
+
+        if failures:
+            status = 400
+            body = f"Disallowed CORS {', '.join(failures)}".encode("utf-8")
+        else:
+            status = 200
+            body = b"OK"
+
+        headers.append((b"content-type", b"text/plain; charset=utf-8"))
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
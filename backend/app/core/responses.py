@@ -0,0 +1,46 @@
+"""JSON response class backed by orjson."""
+import datetime
+import json
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def json_default(obj: Any) -> Any:
+    """
+    orjson fallback for values it can't encode natively (e.g. MySQL columns), encoding
+    them the way FastAPI's jsonable_encoder does so the wire format is unchanged.
+    """
+    if isinstance(obj, Decimal):
+        # Integral DECIMALs (e.g. NUMERIC(x, 0)) stay ints, like fastapi.encoders.decimal_encoder
+        exponent = obj.as_tuple().exponent
+        if isinstance(exponent, int) and exponent >= 0:
+            return int(obj)
+        return float(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode("utf-8", "replace")
+    if isinstance(obj, datetime.timedelta):
+        # MySQL TIME columns arrive as timedelta; FastAPI sends them as seconds
+        return obj.total_seconds()
+    raise TypeError
+
+
+class ORJSONResponse(JSONResponse):
+    """Render response bodies with orjson.
+
+    Defined here rather than using `fastapi.responses.ORJSONResponse`, which
+    newer FastAPI releases deprecate and warn about on every response.
+    """
+
+    def render(self, content: Any) -> bytes:
+        try:
+            return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # orjson rejects ints beyond 64 bits (e.g. DECIMAL(30,0) values); JSONResponse's
+            # encoder doesn't, so fall back to it with the same type conversions
+            return json.dumps(
+                content, default=json_default, ensure_ascii=False, allow_nan=False,
+                indent=None, separators=(",", ":"),
+            ).encode("utf-8")
@@ -1,36 +1,79 @@
 """Service for running evaluations and orchestrating the evaluation process."""
 import asyncio
+import os
+import re
+import secrets
 import time
-import json
-import uuid
 import logging
 from datetime import datetime
-from typing import Dict, List, Any, Union, Optional
+from typing import Dict, List, Any, Union, Optional, Tuple
 from fastapi import HTTPException
 import aiohttp
 
 from .storage_service import (
-    parse_s3_uri, get_file_hash_from_key, fetch_s3_file_content,
+    parse_s3_uri, get_file_hash_from_key, fetch_s3_file_content, fetch_s3_json, parse_json_bytes,
     save_evaluation_metadata_to_s3, save_iteration_response_to_s3, 
-    save_evaluation_results_to_s3, s3_client
+    save_evaluation_results_to_s3, s3_client, put_json_object, list_s3_objects,
+    invalidate_ground_truth_index, dump_json_bytes
 )
 from .comparison_service import (
     filter_ground_truth_by_extraction_types, remove_excluded_fields_from_ground_truth,
-    compare_extraction_results, calculate_overall_metrics, calculate_field_metrics
+    flatten_and_normalize, compare_iteration_results, MetricsAccumulator
 )
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Global evaluation lock to prevent concurrent evaluations
-evaluation_lock = asyncio.Lock()
+# Max evaluation runs in progress at once; further runs wait (FIFO) for a free slot
+MAX_CONCURRENT_EVALUATIONS = int(os.getenv("MAX_CONCURRENT_EVALUATIONS", 4))
+evaluation_semaphore = asyncio.Semaphore(MAX_CONCURRENT_EVALUATIONS)
+
+# Max in-flight get_object_tagging calls when resolving source filenames
+TAGGING_CONCURRENCY = 32
+
+# selected_files entries that look like this are file hashes (source keys are prefix/<hash>.pdf)
+FILE_HASH_PATTERN = re.compile(r"^[0-9a-f]{8,}$")
+
+# Max source files evaluated at once per evaluation run
+FILE_CONCURRENCY = int(os.getenv("FILE_CONCURRENCY", 4))
+
+# Max in-flight extraction API calls per evaluation run
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", 8))
+# Abandon a file's remaining iterations as soon as one fails
+EXTRACTION_FAIL_FAST = os.getenv("EXTRACTION_FAIL_FAST", "false").lower() in ("1", "true", "yes")
+
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared HTTP session for extraction API calls, creating it on first use.
+
+    Reusing one session keeps connections (and their TLS sessions and DNS lookups)
+    alive across uploads, status polls and retrieves. `close_http_session()` is
+    wired to app shutdown.
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=300),
+        )
+    return _http_session
+
+
+async def close_http_session() -> None:
+    """Close the shared HTTP session if it was ever opened."""
+    global _http_session
+    if _http_session is not None:
+        await _http_session.close()
+        _http_session = None
 
 
 def generate_evaluation_run_id() -> str:
     """Generate a unique evaluation run ID with timestamp."""
-    timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S")
-    run_id = str(uuid.uuid4())[:8]  # First 8 chars of UUID
-    return f"{timestamp}-{run_id}"
+    timestamp = time.strftime("%Y-%m-%dT%H-%M-%S", time.gmtime())
+    # 8 random hex chars, the same shape as the first 8 chars of a UUID
+    return f"{timestamp}-{secrets.token_hex(4)}"
 
 
 async def call_extraction_api_async(
@@ -50,75 +93,99 @@ async def call_extraction_api_async(
     - Polls status until completion or timeout
     - Retrieves the final result JSON
     """
-    upload_url = endpoint.rstrip('/') + '/api/v1/upload/'
+    base_url = endpoint.rstrip('/')
+    upload_url = base_url + '/api/v1/upload/'
     headers = {'accept': 'application/json'}
     if oauth_token:
         headers['Authorization'] = f'Bearer {oauth_token}'
 
-    # Build query params
-    params: Dict[str, Any] = {}
-    for ext_type in extraction_types:
-        params.setdefault('extraction_types', []).append(ext_type)
+    # Build query params; extraction_types repeats once per type and is omitted when empty
+    params: Dict[str, Any] = {'extraction_types': list(extraction_types)} if extraction_types else {}
     params['datacontext'] = datacontext
 
-    async with aiohttp.ClientSession() as session:
-        # 1) Upload
-        form_data = aiohttp.FormData()
-        form_data.add_field('file', pdf_content, filename=filename, content_type='application/pdf')
-        async with session.post(upload_url, data=form_data, headers=headers, params=params) as upload_resp:
-            if upload_resp.status not in (200, 202):
-                raise HTTPException(status_code=upload_resp.status, detail=f"Upload failed: {upload_resp.status} {await upload_resp.text()}")
-            upload_body = await upload_resp.json()
-            guid = (
-                upload_body.get('guid')
-                or upload_body.get('id')
-                or upload_body.get('job_id')
-                or upload_body.get('task_id')
-                or upload_body.get('JobId')
-            )
-            if not guid:
-                # Case-insensitive fallback
-                for k, v in upload_body.items():
-                    if isinstance(k, str) and k.lower() in {'guid', 'id', 'job_id', 'task_id', 'jobid'}:
-                        guid = v
-                        break
-            if not guid:
-                raise HTTPException(status_code=500, detail=f"Upload response missing GUID: {upload_body}")
-
-        # 2) Poll status
-        status_url = endpoint.rstrip('/') + f'/api/v1/status/{guid}'
-        retrieve_url = endpoint.rstrip('/') + f'/api/v1/retrieve/{guid}'
-
-        start_ts = time.time()
-        attempt = 0
-        last_status_text = ''
-        while True:
-            attempt += 1
-            async with session.get(status_url, headers=headers) as status_resp:
-                if status_resp.status != 200:
-                    # Treat non-200 as transient for a short while
-                    text = await status_resp.text()
-                    last_status_text = f"HTTP {status_resp.status}: {text}"
-                else:
-                    status_body = await status_resp.json()
-                    status_value = str(status_body.get('status', '')).lower()
-                    # Accept a few common completion labels
-                    if status_value in {'completed', 'complete', 'done', 'finished', 'success'}:
-                        break
-                    if status_value in {'failed', 'error'}:
-                        raise HTTPException(status_code=500, detail=f"Extraction failed for {filename}: {status_body}")
-                    last_status_text = status_value or str(status_body)
+    session = get_http_session()
 
-            if time.time() - start_ts > timeout_s:
-                raise HTTPException(status_code=504, detail=f"Timed out after {timeout_s}s waiting for extraction of {filename}. Last status: {last_status_text}")
+    # 1) Upload
+    form_data = aiohttp.FormData()
+    form_data.add_field('file', pdf_content, filename=filename, content_type='application/pdf')
+    async with session.post(upload_url, data=form_data, headers=headers, params=params) as upload_resp:
+        if upload_resp.status not in (200, 202):
+            raise HTTPException(status_code=upload_resp.status, detail=f"Upload failed: {upload_resp.status} {await upload_resp.text()}")
+        upload_body = await upload_resp.json()
+        guid = (
+            upload_body.get('guid')
+            or upload_body.get('id')
+            or upload_body.get('job_id')
+            or upload_body.get('task_id')
+            or upload_body.get('JobId')
+        )
+        if not guid:
+            # Case-insensitive fallback
+            for k, v in upload_body.items():
+                if isinstance(k, str) and k.lower() in {'guid', 'id', 'job_id', 'task_id', 'jobid'}:
+                    guid = v
+                    break
+        if not guid:
+            raise HTTPException(status_code=500, detail=f"Upload response missing GUID: {upload_body}")
 
-            await asyncio.sleep(poll_interval)
+    # 2) Poll status
+    status_url = f'{base_url}/api/v1/status/{guid}'
+    retrieve_url = f'{base_url}/api/v1/retrieve/{guid}'
 
-        # 3) Retrieve
-        async with session.get(retrieve_url, headers=headers) as retrieve_resp:
-            if retrieve_resp.status != 200:
-                raise HTTPException(status_code=retrieve_resp.status, detail=f"Retrieve failed: {retrieve_resp.status} {await retrieve_resp.text()}")
-            return await retrieve_resp.json()
+    start_ts = time.time()
+    attempt = 0
+    last_status_text = ''
+    while True:
+        attempt += 1
+        async with session.get(status_url, headers=headers) as status_resp:
+            if status_resp.status != 200:
+                # Treat non-200 as transient for a short while
+                text = await status_resp.text()
+                last_status_text = f"HTTP {status_resp.status}: {text}"
+            else:
+                status_body = await status_resp.json()
+                status_value = str(status_body.get('status', '')).lower()
+                # Accept a few common completion labels
+                if status_value in {'completed', 'complete', 'done', 'finished', 'success'}:
+                    break
+                if status_value in {'failed', 'error'}:
+                    raise HTTPException(status_code=500, detail=f"Extraction failed for {filename}: {status_body}")
+                last_status_text = status_value or str(status_body)
+
+        if time.time() - start_ts > timeout_s:
+            raise HTTPException(status_code=504, detail=f"Timed out after {timeout_s}s waiting for extraction of {filename}. Last status: {last_status_text}")
+
+        await asyncio.sleep(poll_interval)
+
+    # 3) Retrieve
+    async with session.get(retrieve_url, headers=headers) as retrieve_resp:
+        if retrieve_resp.status != 200:
+            raise HTTPException(status_code=retrieve_resp.status, detail=f"Retrieve failed: {retrieve_resp.status} {await retrieve_resp.text()}")
+        # Results can be large; parse the raw bytes directly
+        return parse_json_bytes(await retrieve_resp.read())
+
+
+async def resolve_source_filename(bucket: str, key: str, semaphore: asyncio.Semaphore) -> Dict[str, str]:
+    """Look up a source PDF's original_name tag, falling back to the key name."""
+    async with semaphore:
+        try:
+            # Get object tags to find original_name
+            tag_response = await asyncio.to_thread(s3_client.get_object_tagging, Bucket=bucket, Key=key)
+            original_name = None
+            for tag in tag_response.get('TagSet', []):
+                if tag['Key'] == 'original_name':
+                    original_name = tag['Value']
+                    break
+            
+            # Use original_name if found, otherwise fall back to key name
+            filename = original_name if original_name else key.split('/')[-1]
+            print(f"  Using filename: {filename} (original_name: {original_name})")
+        except Exception as e:
+            print(f"Failed to get tags for {key}: {str(e)}")
+            # Fall back to using key name if tag retrieval fails
+            filename = key.split('/')[-1]
+            print(f"  Using fallback filename: {filename}")
+    return {'key': key, 'filename': filename}
 
 
 async def seed_ground_truth_from_extraction(
@@ -155,14 +222,8 @@ async def seed_ground_truth_from_extraction(
             "extracted_data": ground_truth_data
         }
         
-        json_content = json.dumps(seeded_ground_truth, indent=2)
-        
-        s3_client.put_object(
-            Bucket=gt_bucket,
-            Key=gt_key,
-            Body=json_content.encode('utf-8'),
-            ContentType='application/json'
-        )
+        await asyncio.to_thread(put_json_object, gt_bucket, gt_key, seeded_ground_truth)
+        invalidate_ground_truth_index(gt_bucket)
         
         print(f"Seeded ground truth for {filename} -> s3://{gt_bucket}/{gt_key}")
         
@@ -173,87 +234,130 @@ async def seed_ground_truth_from_extraction(
         raise HTTPException(status_code=500, detail=f"Failed to seed ground truth for {filename}: {str(e)}")
 
 
+def score_file_iterations(
+    ground_truth_data: Dict[str, Any],
+    api_responses: List[Dict[str, Any]],
+    filename: str,
+    extraction_types: List[str],
+    excluded_fields: Optional[List[str]]
+) -> Tuple[Dict[str, Any], Dict[str, float], List[str], int, List[Dict[str, float]], List[List[str]]]:
+    """
+    Score every iteration's API response for one file against its ground truth.
+
+    Returns (filtered_ground_truth, scores, mismatches, true_negatives, iteration_scores,
+    iteration_mismatches), where the unprefixed values are those of the last iteration.
+    """
+    scores: Dict[str, float] = {}
+    mismatches: List[str] = []
+    true_negatives = 0
+    iteration_scores = []
+    iteration_mismatches = []
+    
+    # Filter ground truth based on selected extraction types
+    filtered_ground_truth = filter_ground_truth_by_extraction_types(ground_truth_data, extraction_types)
+    
+    # Remove excluded fields from ground truth (None and [] both mean nothing to remove)
+    if excluded_fields:
+        filtered_ground_truth = remove_excluded_fields_from_ground_truth(filtered_ground_truth, excluded_fields)
+    
+    # Flatten and normalize the ground truth once; it is the same for every iteration
+    gt_flat, gt_norm = flatten_and_normalize(filtered_ground_truth)
+    
+    extraction_type_set = set(extraction_types)
+    
+    compared_responses = []
+    for api_response in api_responses:
+        # Also apply exclusions to API response for fair comparison
+        if excluded_fields is not None:
+            api_extracted_data = api_response.get("extracted_data", api_response)
+            if extraction_type_set.issuperset(api_extracted_data.keys()):
+                # Response already holds only the requested types; filtering would just rebuild it
+                filtered_api_extracted_data = api_extracted_data
+            else:
+                filtered_api_extracted_data = filter_ground_truth_by_extraction_types(
+                    api_extracted_data, extraction_types
+                )
+            filtered_api_extracted_data = remove_excluded_fields_from_ground_truth(
+                filtered_api_extracted_data, excluded_fields
+            )
+            compared_responses.append({"extracted_data": filtered_api_extracted_data})
+        else:
+            compared_responses.append(api_response)
+    
+    # Calculate scores for each iteration (identical responses are only compared once)
+    results = compare_iteration_results(filtered_ground_truth, compared_responses, gt_flat, gt_norm)
+    for idx, (iter_scores, iter_mismatches, iter_true_negatives) in enumerate(results):
+        # Add iteration info to mismatches
+        prefix = f"[{filename} | Iter {idx + 1}] "
+        iter_mismatches = [prefix + mismatch for mismatch in iter_mismatches]
+        
+        iteration_scores.append(iter_scores)
+        iteration_mismatches.append(iter_mismatches)
+        # TN is encoded per-field in scores (0.0), no need to collect per-iteration TN
+        
+        # Use the last iteration for the main scores (backward compatibility)
+        if idx == len(api_responses) - 1:
+            scores = iter_scores
+            mismatches = iter_mismatches
+            true_negatives = iter_true_negatives
+    
+    return filtered_ground_truth, scores, mismatches, true_negatives, iteration_scores, iteration_mismatches
+
+
 async def run_evaluation_task(evaluation_id: str, request, evaluation_store: Dict):
     """Background task to run the actual evaluation."""
     try:
-        # Add a startup delay to give frontend time to start polling
-        logger.info(f"Evaluation {evaluation_id}: Starting in 2 seconds to allow frontend setup...")
-        await asyncio.sleep(2.0)
-        
-        # Wait for the evaluation lock to ensure only one evaluation runs at a time
-        async with evaluation_lock:
-            # Update status to running once we acquire the lock
+        # Wait for a free evaluation slot; runs share no state, so several can proceed at once
+        async with evaluation_semaphore:
+            # Update status to running once we acquire a slot
             result = evaluation_store[evaluation_id]
             result.status = "running"
-            logger.info(f"Starting evaluation {evaluation_id} - acquired lock")
+            logger.info(f"Starting evaluation {evaluation_id} - acquired slot")
             
             # Use the evaluation_run_id that was set in the request
             evaluation_run_id = request.evaluation_run_id
             
-            # Save evaluation metadata to S3 if responses_uri is provided
-            if request.responses_uri:
-                try:
-                    metadata_config = {
-                        "source_data_uri": request.source_data_uri,
-                        "ground_truth_uri": request.ground_truth_uri,
-                        "extraction_endpoint": request.extraction_endpoint,
-                        "extraction_types": request.extraction_types,
-                        "excluded_fields": request.excluded_fields,
-                        "iterations": request.iterations,
-                        "selected_files": request.selected_files
-                    }
-                    metadata_path = await save_evaluation_metadata_to_s3(
-                        evaluation_run_id, metadata_config, request.responses_uri
-                    )
-                    print(f"Saved evaluation metadata to: {metadata_path}")
-                except Exception as metadata_error:
-                    print(f"Failed to save evaluation metadata: {str(metadata_error)}")
-            
             # Parse S3 URIs
             source_bucket, source_prefix = parse_s3_uri(request.source_data_uri)
             gt_bucket, gt_prefix = parse_s3_uri(request.ground_truth_uri)
             
             # List source files and get their original names from tags
-            source_response = s3_client.list_objects_v2(Bucket=source_bucket, Prefix=source_prefix)
-            print(f"Found {len(source_response.get('Contents', []))} objects in S3 bucket {source_bucket} with prefix {source_prefix}")
-            
-            all_source_files = []
+            source_objects = await asyncio.to_thread(list_s3_objects, source_bucket, source_prefix)
+            print(f"Found {len(source_objects)} objects in S3 bucket {source_bucket} with prefix {source_prefix}")
             
-            for obj in source_response.get('Contents', []):
+            pdf_keys = []
+            for obj in source_objects:
                 print(f"Processing S3 object: {obj['Key']}")
                 if obj['Key'].endswith('.pdf'):
-                    try:
-                        # Get object tags to find original_name
-                        tag_response = s3_client.get_object_tagging(Bucket=source_bucket, Key=obj['Key'])
-                        original_name = None
-                        for tag in tag_response.get('TagSet', []):
-                            if tag['Key'] == 'original_name':
-                                original_name = tag['Value']
-                                break
-                        
-                        # Use original_name if found, otherwise fall back to key name
-                        filename = original_name if original_name else obj['Key'].split('/')[-1]
-                        print(f"  Using filename: {filename} (original_name: {original_name})")
-                        all_source_files.append({
-                            'key': obj['Key'],
-                            'filename': filename
-                        })
-                    except Exception as e:
-                        print(f"Failed to get tags for {obj['Key']}: {str(e)}")
-                        # Fall back to using key name if tag retrieval fails
-                        filename = obj['Key'].split('/')[-1]
-                        print(f"  Using fallback filename: {filename}")
-                        all_source_files.append({
-                            'key': obj['Key'],
-                            'filename': filename
-                        })
+                    pdf_keys.append(obj['Key'])
                 else:
                     print(f"  Skipping non-PDF file: {obj['Key']}")
             
+            # A selection made of file hashes can be applied to the keys directly, which skips
+            # the tag lookups for every object that is not selected
+            select_by_hash = bool(request.selected_files) and all(
+                FILE_HASH_PATTERN.match(name) for name in request.selected_files
+            )
+            if select_by_hash:
+                selected_hashes = set(request.selected_files)
+                total_pdf_count = len(pdf_keys)
+                pdf_keys = [key for key in pdf_keys if get_file_hash_from_key(key) in selected_hashes]
+                print(f"Selected {len(pdf_keys)} of {total_pdf_count} files by hash")
+            
+            # Tag lookups are independent round trips, so issue them concurrently (bounded)
+            tag_semaphore = asyncio.Semaphore(TAGGING_CONCURRENCY)
+            all_source_files = await asyncio.gather(
+                *(resolve_source_filename(source_bucket, key, tag_semaphore) for key in pdf_keys)
+            )
+            
             # Filter source files based on selected_files parameter
             print(f"Available files: {[f['filename'] for f in all_source_files]}")
             
-            if request.selected_files:
+            if select_by_hash:
+                # Already filtered by key above
+                source_files = all_source_files
+                print(f"Selected files to process: {[f['filename'] for f in source_files]}")
+            elif request.selected_files:
                 # Filter to only include selected files
                 selected_filenames = set(request.selected_files)
                 source_files = [file_info for file_info in all_source_files if file_info['filename'] in selected_filenames]
@@ -264,10 +368,35 @@ async def run_evaluation_task(evaluation_id: str, request, evaluation_store: Dic
                 source_files = all_source_files
                 print(f"Processing all {len(source_files)} files (no selection provided)")
             
+            # Save evaluation metadata to S3 if responses_uri is provided
+            if request.responses_uri:
+                try:
+                    metadata_config = {
+                        "source_data_uri": request.source_data_uri,
+                        "ground_truth_uri": request.ground_truth_uri,
+                        "extraction_endpoint": request.extraction_endpoint,
+                        "extraction_types": request.extraction_types,
+                        "excluded_fields": request.excluded_fields,
+                        "iterations": request.iterations,
+                        "selected_files": request.selected_files
+                    }
+                    # Record the original names resolved from tags so history loads need no tag lookups
+                    original_names = {
+                        get_file_hash_from_key(file_info['key']): file_info['filename']
+                        for file_info in source_files
+                        if file_info['filename'] != file_info['key'].rpartition('/')[2]
+                    }
+                    metadata_path = await save_evaluation_metadata_to_s3(
+                        evaluation_run_id, metadata_config, request.responses_uri, original_names
+                    )
+                    print(f"Saved evaluation metadata to: {metadata_path}")
+                except Exception as metadata_error:
+                    print(f"Failed to save evaluation metadata: {str(metadata_error)}")
+            
             # List ground truth files
-            gt_response = s3_client.list_objects_v2(Bucket=gt_bucket, Prefix=gt_prefix)
+            gt_objects = await asyncio.to_thread(list_s3_objects, gt_bucket, gt_prefix)
             gt_files = {get_file_hash_from_key(obj['Key']): obj['Key'] 
-                       for obj in gt_response.get('Contents', []) if obj['Key'].endswith('.json')}
+                       for obj in gt_objects if obj['Key'].endswith('.json')}
             
             # Initialize result
             result = evaluation_store[evaluation_id]
@@ -282,155 +411,163 @@ async def run_evaluation_task(evaluation_id: str, request, evaluation_store: Dic
                 logger.info(f"Evaluation {evaluation_id}: Using pre-calculated total_iterations = {result.total_iterations} for {len(source_files)} selected files")
             
             document_evaluations = []
-            all_scores = []
+            # Metrics are tallied as each file's scores arrive instead of collecting every score dict
+            metrics_accumulator = MetricsAccumulator()
+            extraction_semaphore = asyncio.Semaphore(EXTRACTION_CONCURRENCY)
             
-            for file_info in source_files:
-                try:
-                    source_key = file_info['key']
-                    filename = file_info['filename']
-                    file_hash = get_file_hash_from_key(source_key)
-                    
-                    logger.info(f"Evaluation {evaluation_id}: Starting file {result.completed_files + 1}/{len(source_files)}: {filename} (hash: {file_hash})")
-                    
-                    # Check if ground truth exists - but don't skip if missing
-                    ground_truth_data = None
-                    if file_hash in gt_files:
-                        # Fetch ground truth
-                        gt_content = await fetch_s3_file_content(gt_bucket, gt_files[file_hash])
-                        ground_truth = json.loads(gt_content.decode('utf-8'))
-                        # Extract only the extracted_data part for comparison
-                        ground_truth_data = ground_truth.get('extracted_data', ground_truth)
-                    else:
-                        # Log that ground truth is missing but continue processing
-                        print(f"No ground truth found for {filename} (hash: {file_hash}), proceeding with extraction only")
-                    
-                    # Fetch PDF content
-                    pdf_content = await fetch_s3_file_content(source_bucket, source_key)
-                    
-                    # Run multiple iterations
-                    api_responses = []
-                    for iteration in range(request.iterations):
-                        try:
-                            logger.info(f"Evaluation {evaluation_id}: Starting iteration {iteration + 1}/{request.iterations} for {filename} (current progress: {result.completed_iterations}/{result.total_iterations})")
-                            api_response = await call_extraction_api_async(
-                                pdf_content, filename, request.extraction_endpoint,
-                                request.extraction_types, request.oauth_token
-                            )
-                            api_responses.append(api_response)
-                            logger.info(f"Evaluation {evaluation_id}: API call completed for iteration {iteration + 1} of {filename}")
-                            
-                            # Update iteration progress
-                            result.completed_iterations += 1
-                            logger.info(f"Evaluation {evaluation_id}: Completed iteration {result.completed_iterations}/{result.total_iterations} (file: {filename}, iteration: {iteration + 1})")
-                            
-                            # Add a delay between iterations to allow frontend polling to see progress
-                            # This helps with progress tracking visibility
-                            if iteration < request.iterations - 1:  # Don't delay after the last iteration
-                                logger.info(f"Evaluation {evaluation_id}: Waiting 5 seconds before next iteration...")
-                                await asyncio.sleep(5.0)  # Increased to 5 seconds for very visible progress
-                            
-                            # Save iteration response to S3 if responses_uri is provided
-                            if request.responses_uri:
+            # Files are independent, so several are evaluated at once; extraction_semaphore still
+            # caps the extraction API calls in flight across all of them
+            file_semaphore = asyncio.Semaphore(FILE_CONCURRENCY)
+            from ..api.v1.evaluation import DocumentEvaluation
+            
+            async def evaluate_file(file_info: Dict[str, str]) -> Optional[Tuple[Any, List[Dict[str, float]]]]:
+                """Evaluate one source file; returns (document evaluation, per-iteration scores) or None on failure."""
+                source_key = file_info['key']
+                filename = file_info['filename']
+                file_hash = get_file_hash_from_key(source_key)
+                async with file_semaphore:
+                    # Start the PDF download now so it overlaps the ground truth fetch
+                    pdf_task = asyncio.create_task(fetch_s3_file_content(source_bucket, source_key))
+                    # Uploads run in the background so a PUT doesn't hold an extraction slot;
+                    # they're awaited once the file is scored, or when it fails
+                    save_tasks: List[asyncio.Task] = []
+                    try:
+                        logger.info(f"Evaluation {evaluation_id}: Starting file {filename} (hash: {file_hash}, {result.completed_files}/{len(source_files)} files done)")
+                        
+                        # Check if ground truth exists - but don't skip if missing
+                        ground_truth_data = None
+                        if file_hash in gt_files:
+                            # Fetch ground truth
+                            ground_truth = await fetch_s3_json(gt_bucket, gt_files[file_hash])
+                            # Extract only the extracted_data part for comparison
+                            ground_truth_data = ground_truth.get('extracted_data', ground_truth)
+                        else:
+                            # Log that ground truth is missing but continue processing
+                            print(f"No ground truth found for {filename} (hash: {file_hash}), proceeding with extraction only")
+                        
+                        # Fetch PDF content
+                        pdf_content = await pdf_task
+                        
+                        async def save_response(api_response: Dict[str, Any], iteration: int) -> None:
+                            try:
+                                saved_path = await save_iteration_response_to_s3(
+                                    api_response, file_hash, iteration + 1, evaluation_run_id, request.responses_uri
+                                )
+                                print(f"Saved iteration {iteration + 1} response to: {saved_path}")
+                            except Exception as save_error:
+                                result.errors.append(f"Failed to save iteration {iteration + 1} for {filename}: {str(save_error)}")
+                        
+                        # Run iterations concurrently; the shared semaphore caps in-flight calls across files
+                        async def run_iteration(iteration: int) -> Optional[Dict[str, Any]]:
+                            async with extraction_semaphore:
                                 try:
-                                    saved_path = await save_iteration_response_to_s3(
-                                        api_response, file_hash, iteration + 1, evaluation_run_id, request.responses_uri
+                                    logger.info(f"Evaluation {evaluation_id}: Starting iteration {iteration + 1}/{request.iterations} for {filename} (current progress: {result.completed_iterations}/{result.total_iterations})")
+                                    api_response = await call_extraction_api_async(
+                                        pdf_content, filename, request.extraction_endpoint,
+                                        request.extraction_types, request.oauth_token
                                     )
-                                    print(f"Saved iteration {iteration + 1} response to: {saved_path}")
-                                except Exception as save_error:
-                                    result.errors.append(f"Failed to save iteration {iteration + 1} for {filename}: {str(save_error)}")
-                            
-                        except Exception as e:
-                            logger.error(f"Iteration {iteration + 1} failed for {filename}: {str(e)}")
-                            result.errors.append(f"Iteration {iteration + 1} failed for {filename}: {str(e)}")
-                    
-                    if not api_responses:
-                        result.errors.append(f"All iterations failed for {filename}")
-                        continue
-
-                    # Calculate scores and mismatches for each iteration if ground truth exists
-                    scores = {}
-                    mismatches = []
-                    true_negatives = 0
-                    iteration_scores = []
-                    iteration_mismatches = []
-                    # Legacy: iteration_true_negatives no longer needed (TN is encoded per-field as score 0.0)
-                    
-                    if ground_truth_data:
-                        # Filter ground truth based on selected extraction types
-                        filtered_ground_truth = filter_ground_truth_by_extraction_types(ground_truth_data, request.extraction_types)
+                                    logger.info(f"Evaluation {evaluation_id}: API call completed for iteration {iteration + 1} of {filename}")
+                                
+                                    # Update iteration progress
+                                    result.completed_iterations += 1
+                                    logger.info(f"Evaluation {evaluation_id}: Completed iteration {result.completed_iterations}/{result.total_iterations} (file: {filename}, iteration: {iteration + 1})")
+                                
+                                    # Save iteration response to S3 if responses_uri is provided
+                                    if request.responses_uri:
+                                        save_tasks.append(asyncio.create_task(save_response(api_response, iteration)))
+                                
+                                    return api_response
+                                except Exception as e:
+                                    logger.error(f"Iteration {iteration + 1} failed for {filename}: {str(e)}")
+                                    result.errors.append(f"Iteration {iteration + 1} failed for {filename}: {str(e)}")
+                                    if EXTRACTION_FAIL_FAST:
+                                        raise
+                                    return None
                         
-                        # Remove excluded fields from ground truth
-                        if request.excluded_fields is not None:
-                            filtered_ground_truth = remove_excluded_fields_from_ground_truth(filtered_ground_truth, request.excluded_fields)
+                        iteration_tasks = [asyncio.create_task(run_iteration(i)) for i in range(request.iterations)]
+                        try:
+                            iteration_results = await asyncio.gather(*iteration_tasks)
+                        except Exception:
+                            # Fail fast: stop the file's remaining iterations instead of waiting them out
+                            for task in iteration_tasks:
+                                task.cancel()
+                            await asyncio.gather(*iteration_tasks, return_exceptions=True)
+                            raise
+                        # Results keep iteration order regardless of completion order
+                        api_responses = [r for r in iteration_results if r is not None]
                         
-                        # Calculate scores for each iteration
-                        for idx, api_response in enumerate(api_responses):
-                            # Also apply exclusions to API response for fair comparison
-                            if request.excluded_fields is not None:
-                                api_extracted_data = api_response.get("extracted_data", api_response)
-                                filtered_api_extracted_data = filter_ground_truth_by_extraction_types(
-                                    api_extracted_data, request.extraction_types
-                                )
-                                filtered_api_extracted_data = remove_excluded_fields_from_ground_truth(
-                                    filtered_api_extracted_data, request.excluded_fields
-                                )
-                                filtered_api_response = {"extracted_data": filtered_api_extracted_data}
-                                iter_scores, iter_mismatches, iter_true_negatives = compare_extraction_results(filtered_ground_truth, filtered_api_response)
-                            else:
-                                iter_scores, iter_mismatches, iter_true_negatives = compare_extraction_results(filtered_ground_truth, api_response)
-                            # Add iteration info to mismatches
-                            iter_mismatches = [f"[{filename} | Iter {idx + 1}] {mismatch}" for mismatch in iter_mismatches]
-                            
-                            iteration_scores.append(iter_scores)
-                            iteration_mismatches.append(iter_mismatches)
-                            # TN is encoded per-field in scores (0.0), no need to collect per-iteration TN
-                            
-                            # Use the last iteration for the main scores (backward compatibility)
-                            if idx == len(api_responses) - 1:
-                                scores = iter_scores
-                                mismatches = iter_mismatches
-                                true_negatives = iter_true_negatives
-                    
-                    # Create document evaluation with proper model import
-                    from ..api.v1.evaluation import DocumentEvaluation
-                    document_eval = DocumentEvaluation(
-                        filename=filename,
-                        file_hash=file_hash,
-                        ground_truth=filtered_ground_truth if ground_truth_data else None,  # Use filtered ground truth
-                        api_responses=api_responses,
-                        scores=scores,  # Will be empty dict if no ground truth
-                        mismatches=mismatches,  # Will be empty list if no ground truth
-                        true_negatives=true_negatives,
-                        iteration_scores=iteration_scores if ground_truth_data else None,
-                        iteration_mismatches=iteration_mismatches if ground_truth_data else None
-                    )
-                    
+                        if not api_responses:
+                            result.errors.append(f"All iterations failed for {filename}")
+                            return None
+
+                        # Calculate scores and mismatches for each iteration if ground truth exists
+                        scores = {}
+                        mismatches = []
+                        true_negatives = 0
+                        iteration_scores = []
+                        iteration_mismatches = []
+                        # Legacy: iteration_true_negatives no longer needed (TN is encoded per-field as score 0.0)
+                        
+                        if ground_truth_data:
+                            # Scoring is pure CPU work; run it in a worker thread so the event loop keeps serving requests
+                            (
+                                filtered_ground_truth, scores, mismatches, true_negatives,
+                                iteration_scores, iteration_mismatches
+                            ) = await asyncio.to_thread(
+                                score_file_iterations, ground_truth_data, api_responses, filename,
+                                request.extraction_types, request.excluded_fields
+                            )
+                        
+                        # Barrier: every response is stored before the file counts as completed
+                        if save_tasks:
+                            await asyncio.gather(*save_tasks)
+                        
+                        document_eval = DocumentEvaluation(
+                            filename=filename,
+                            file_hash=file_hash,
+                            ground_truth=filtered_ground_truth if ground_truth_data else None,  # Use filtered ground truth
+                            api_responses=api_responses,
+                            scores=scores,  # Will be empty dict if no ground truth
+                            mismatches=mismatches,  # Will be empty list if no ground truth
+                            true_negatives=true_negatives,
+                            iteration_scores=iteration_scores if ground_truth_data else None,
+                            iteration_mismatches=iteration_mismatches if ground_truth_data else None
+                        )
+                        
+                        result.completed_files += 1
+                        logger.info(f"Evaluation {evaluation_id}: Completed file {result.completed_files}/{len(source_files)}: {filename}")
+                        
+                        if iteration_scores:
+                            return document_eval, iteration_scores
+                        return document_eval, [scores] if scores else []
+                        
+                    except Exception as e:
+                        result.errors.append(f"Failed to evaluate {filename} ({source_key}): {str(e)}")
+                        return None
+                    finally:
+                        # Settle the download and any uploads still running before the file is reported,
+                        # retrieving their exceptions (upload errors are already recorded by save_response)
+                        pdf_task.cancel()
+                        await asyncio.gather(pdf_task, *save_tasks, return_exceptions=True)
+            
+            # gather keeps source file order for the documents and scores
+            file_results = await asyncio.gather(*(evaluate_file(file_info) for file_info in source_files))
+            for file_result in file_results:
+                if file_result is not None:
+                    document_eval, file_scores = file_result
                     document_evaluations.append(document_eval)
-                    
-                    if iteration_scores:
-                        all_scores.extend(iteration_scores)
-                    elif scores:
-                        all_scores.append(scores)
-                    
-                    result.completed_files += 1
-                    
-                    # Add a small delay between files to make progress visible across multiple files
-                    if len(source_files) > 1 and result.completed_files < len(source_files):
-                        logger.info(f"Evaluation {evaluation_id}: Completed file {result.completed_files}/{len(source_files)}, waiting 3 seconds before next file...")
-                        await asyncio.sleep(3.0)  # Increased to 3 seconds
-                    
-                except Exception as e:
-                    result.errors.append(f"Failed to evaluate {filename} ({source_key}): {str(e)}")
+                    for iteration_scores in file_scores:
+                        metrics_accumulator.add(iteration_scores)
             
             # Calculate overall metrics and field-level metrics
-            result.metrics = calculate_overall_metrics(all_scores)
-            field_metrics = calculate_field_metrics(all_scores)
+            result.metrics = metrics_accumulator.overall_metrics()
+            field_metrics = metrics_accumulator.field_metrics
             result.documents = document_evaluations
             result.status = "completed"
             
             logger.info(f"🏁 Evaluation {evaluation_id} completed successfully! Final state: {result.completed_iterations}/{result.total_iterations} iterations, {result.completed_files}/{result.total_files} files")
             
-            logger.info(f"Evaluation {evaluation_id} completed successfully - releasing lock")
+            logger.info(f"Evaluation {evaluation_id} completed successfully - releasing slot")
             
             # Save final results to S3 if responses_uri is provided
             if request.responses_uri:
@@ -439,7 +576,7 @@ async def run_evaluation_task(evaluation_id: str, request, evaluation_store: Dic
                         "evaluation_run_id": evaluation_run_id,
                         "evaluation_id": evaluation_id,
                         "status": result.status,
-                        "metrics": result.metrics.dict(),
+                        "metrics": result.metrics.model_dump(),
                         "total_files": result.total_files,
                         "completed_files": result.completed_files,
                         "total_iterations": result.total_iterations,
@@ -466,8 +603,7 @@ async def run_evaluation_task(evaluation_id: str, request, evaluation_store: Dic
             
             # Persist overall metrics and field metrics to MySQL for dashboarding
             try:
-                from ..api.v1.db import _pool, _vars
-                _vars()
+                from ..api.v1.db import _pool
                 pool = await _pool()
                 async with pool.acquire() as conn:
                     async with conn.cursor() as cur:
@@ -501,7 +637,7 @@ async def run_evaluation_task(evaluation_id: str, request, evaluation_store: Dic
                                 result.metrics.false_negatives,
                                 request.ground_truth_uri,  # ground_truth_file_id
                                 None,  # extraction_run_id (can be NULL)
-                                json.dumps({
+                                dump_json_bytes({
                                     "source_data_uri": request.source_data_uri,
                                     "ground_truth_uri": request.ground_truth_uri,
                                     "extraction_endpoint": request.extraction_endpoint,
@@ -509,7 +645,7 @@ async def run_evaluation_task(evaluation_id: str, request, evaluation_store: Dic
                                     "excluded_fields": request.excluded_fields,
                                     "iterations": request.iterations,
                                     "selected_files": request.selected_files,
-                                }),
+                                }).decode('utf-8'),
                             ),
                         )
                         
@@ -568,7 +704,6 @@ async def run_evaluation_task(evaluation_id: str, request, evaluation_store: Dic
                             )
                             logger.info(f"Successfully inserted field performance for {field_name}")
                         
-                pool.close(); await pool.wait_closed()
                 logger.info(f"Saved evaluation metrics and field performance to DB for run {evaluation_run_id}")
             except Exception as db_error:
                 logger.error(f"Failed to save evaluation metrics to DB: {db_error}")
@@ -577,4 +712,4 @@ async def run_evaluation_task(evaluation_id: str, request, evaluation_store: Dic
         result = evaluation_store[evaluation_id]
         result.status = "failed"
         result.errors.append(f"Evaluation failed: {str(e)}")
-        logger.error(f"Evaluation {evaluation_id} failed: {str(e)} - releasing lock") 
\ No newline at end of file
+        logger.error(f"Evaluation {evaluation_id} failed: {str(e)} - releasing slot") 
\ No newline at end of file
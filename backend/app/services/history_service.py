@@ -1,51 +1,90 @@
 """Service for loading evaluation history and managing ground truth data."""
-import json
+import asyncio
+from urllib.parse import unquote_plus
 from typing import Dict, List, Any, Optional
 from fastapi import HTTPException
 
 from .storage_service import (
-    parse_s3_uri, get_file_hash_from_key, fetch_s3_file_content, s3_client
+    parse_s3_uri, get_file_hash_from_key, fetch_s3_json, s3_client,
+    list_s3_objects, load_s3_json, get_ground_truth_index, get_run_base
 )
 from .comparison_service import (
     filter_ground_truth_by_extraction_types, remove_excluded_fields_from_ground_truth,
-    compare_extraction_results, calculate_overall_metrics
+    compare_iteration_results, MetricsAccumulator, flatten_and_normalize
 )
+from .evaluation_runner_service import resolve_source_filename, TAGGING_CONCURRENCY
+
+# Max evaluation files loaded (ground truth, responses, tags) at once when reading a run back from S3
+LOAD_FILE_CONCURRENCY = 16
+
+
+async def _original_filename_from_tags(file_hash: str, config: Dict[str, Any]) -> str:
+    """Look up a source PDF's original_name tag by file hash; returns the hash if none is found."""
+    filename = file_hash
+    try:
+        # Determine the source file bucket and prefix from config
+        source_data_uri = config.get('source_data_uri')
+        if source_data_uri:
+            source_bucket, source_prefix = parse_s3_uri(source_data_uri)
+            
+            # Construct the likely S3 key for the source file
+            # Try common extensions
+            for ext in ['.pdf', '.PDF']:
+                source_key = f"{source_prefix.rstrip('/')}/{file_hash}{ext}" if source_prefix else f"{file_hash}{ext}"
+                try:
+                    # Get object tags to find original filename
+                    tags_response = await asyncio.to_thread(
+                        s3_client.get_object_tagging,
+                        Bucket=source_bucket,
+                        Key=source_key
+                    )
+                    
+                    # Look for original_name tag
+                    for tag in tags_response.get('TagSet', []):
+                        if tag['Key'] == 'original_name':
+                            filename = unquote_plus(tag['Value'])
+                            print(f"Found original filename from S3 tags: {filename}")
+                            break
+                    
+                    if filename != file_hash:
+                        break  # Found filename, stop trying extensions
+                        
+                except Exception as tag_error:
+                    print(f"Could not get tags for {source_key}: {tag_error}")
+                    continue
+
+    except Exception as e:
+        print(f"Could not retrieve filename from S3 tags: {e}")
+    
+    return filename
 
 
 async def load_evaluation_from_s3(run_id: str, responses_uri: str):
     """Load evaluation results from S3 using run ID."""
     try:
-        # Parse responses S3 URI
-        responses_bucket, responses_prefix = parse_s3_uri(responses_uri)
+        # Resolve the run folder under the responses S3 URI
+        responses_bucket, run_base = get_run_base(responses_uri, run_id)
         
         # Build paths for metadata and results
-        if responses_prefix:
-            metadata_key = f"{responses_prefix.rstrip('/')}/{run_id}/metadata.json"
-            results_key = f"{responses_prefix.rstrip('/')}/{run_id}/results/summary.json"
-            responses_prefix_path = f"{responses_prefix.rstrip('/')}/{run_id}/responses/"
-        else:
-            metadata_key = f"{run_id}/metadata.json"
-            results_key = f"{run_id}/results/summary.json"
-            responses_prefix_path = f"{run_id}/responses/"
+        metadata_key = f"{run_base}/metadata.json"
+        results_key = f"{run_base}/results/summary.json"
+        responses_prefix_path = f"{run_base}/responses/"
         
         print(f"Loading evaluation from S3:")
         print(f"  Metadata: s3://{responses_bucket}/{metadata_key}")
         print(f"  Results: s3://{responses_bucket}/{results_key}")
         print(f"  Responses: s3://{responses_bucket}/{responses_prefix_path}")
         
-        # Load metadata
-        try:
-            metadata_content = await fetch_s3_file_content(responses_bucket, metadata_key)
-            metadata = json.loads(metadata_content.decode('utf-8'))
-        except Exception as e:
-            raise HTTPException(status_code=404, detail=f"Evaluation metadata not found for run {run_id}: {str(e)}")
-        
-        # Load results summary if available
-        try:
-            results_content = await fetch_s3_file_content(responses_bucket, results_key)
-            results_summary = json.loads(results_content.decode('utf-8'))
-        except Exception as e:
-            print(f"Results summary not found for run {run_id}: {str(e)}")
+        # Load metadata and the results summary (if available) together
+        metadata, results_summary = await asyncio.gather(
+            load_s3_json(responses_bucket, metadata_key),
+            load_s3_json(responses_bucket, results_key),
+            return_exceptions=True
+        )
+        if isinstance(metadata, Exception):
+            raise HTTPException(status_code=404, detail=f"Evaluation metadata not found for run {run_id}: {str(metadata)}")
+        if isinstance(results_summary, Exception):
+            print(f"Results summary not found for run {run_id}: {str(results_summary)}")
             results_summary = None
         
         # Get ground truth URI from metadata
@@ -58,17 +97,15 @@ async def load_evaluation_from_s3(run_id: str, responses_uri: str):
         gt_bucket, gt_prefix = parse_s3_uri(ground_truth_uri)
         
         # List all response files for this run
-        response_objects = s3_client.list_objects_v2(
-            Bucket=responses_bucket, 
-            Prefix=responses_prefix_path
-        )
+        response_objects = await asyncio.to_thread(list_s3_objects, responses_bucket, responses_prefix_path)
         
         documents = []
-        all_scores = []
+        # Overall metrics are tallied as documents are collected instead of keeping every score dict
+        metrics_accumulator = MetricsAccumulator(track_fields=False)
         
         # Group responses by file hash
         file_responses = {}
-        for obj in response_objects.get('Contents', []):
+        for obj in response_objects:
             key = obj['Key']
             if key.endswith('.json'):
                 # Extract file hash and iteration from path
@@ -85,149 +122,129 @@ async def load_evaluation_from_s3(run_id: str, responses_uri: str):
         
         print(f"Found responses for {len(file_responses)} files")
         
-        # Process each file's responses
-        for file_hash, iterations in file_responses.items():
-            try:
-                # Load ground truth for this file
-                gt_key = f"{gt_prefix.rstrip('/')}/{file_hash}.json"
-                ground_truth_data = None
-                ground_truth_full = None
+        # Process each file's responses; files load concurrently, bounded by the semaphore
+        file_semaphore = asyncio.Semaphore(LOAD_FILE_CONCURRENCY)
+        
+        async def load_file(file_hash: str, iterations: Dict[int, str]):
+            async with file_semaphore:
                 try:
-                    gt_content = await fetch_s3_file_content(gt_bucket, gt_key)
-                    ground_truth_full = json.loads(gt_content.decode('utf-8'))
-                    ground_truth_data = ground_truth_full.get('extracted_data', ground_truth_full)
-                except Exception as e:
-                    print(f"No ground truth found for {file_hash}: {str(e)}")
-                
-                # Load all iterations for this file
-                api_responses = []
-                sorted_iterations = sorted(iterations.keys())
-                for iteration in sorted_iterations:
-                    response_key = iterations[iteration]
+                    # Load ground truth and all iterations for this file together; downloads and
+                    # parsing overlap in worker threads
+                    gt_key = f"{gt_prefix.rstrip('/')}/{file_hash}.json"
+                    response_keys = [iterations[iteration] for iteration in sorted(iterations.keys())]
+                    ground_truth_full, *loaded_responses = await asyncio.gather(
+                        fetch_s3_json(gt_bucket, gt_key),
+                        *(load_s3_json(responses_bucket, response_key) for response_key in response_keys),
+                        return_exceptions=True
+                    )
+                    
+                    ground_truth_data = None
                     try:
-                        response_content = await fetch_s3_file_content(responses_bucket, response_key)
-                        api_response = json.loads(response_content.decode('utf-8'))
-                        api_responses.append(api_response)
+                        if isinstance(ground_truth_full, Exception):
+                            raise ground_truth_full
+                        ground_truth_data = ground_truth_full.get('extracted_data', ground_truth_full)
                     except Exception as e:
-                        print(f"Failed to load response {response_key}: {str(e)}")
-                
-                if not api_responses:
-                    print(f"No valid responses found for {file_hash}")
-                    continue
-                
-                # Get filename from S3 object tags (where original filename is stored)
-                filename = file_hash  # Default fallback
-                
-                # Try to get the original filename from S3 object tags
-                try:
-                    # Determine the source file bucket and prefix from config
-                    config = metadata.get('config', {})
-                    source_data_uri = config.get('source_data_uri')
-                    if source_data_uri:
-                        source_bucket, source_prefix = parse_s3_uri(source_data_uri)
-                        
-                        # Construct the likely S3 key for the source file
-                        # Try common extensions
-                        for ext in ['.pdf', '.PDF']:
-                            source_key = f"{source_prefix.rstrip('/')}/{file_hash}{ext}" if source_prefix else f"{file_hash}{ext}"
-                            try:
-                                # Get object tags to find original filename
-                                tags_response = s3_client.get_object_tagging(
-                                    Bucket=source_bucket,
-                                    Key=source_key
-                                )
-                                
-                                # Look for original_name tag
-                                for tag in tags_response.get('TagSet', []):
-                                    if tag['Key'] == 'original_name':
-                                        from urllib.parse import unquote_plus
-                                        filename = unquote_plus(tag['Value'])
-                                        print(f"Found original filename from S3 tags: {filename}")
-                                        break
-                                
-                                if filename != file_hash:
-                                    break  # Found filename, stop trying extensions
-                                    
-                            except Exception as tag_error:
-                                print(f"Could not get tags for {source_key}: {tag_error}")
-                                continue
-
-                except Exception as e:
-                    print(f"Could not retrieve filename from S3 tags: {e}")
-                
-                # Fall back to API response filename if not found in S3 tags
-                if filename == file_hash and api_responses and 'filename' in api_responses[0]:
-                    filename = api_responses[0]['filename']
-                
-                # Final fallback: if we still have file_hash, try to construct a reasonable filename
-                if filename == file_hash:
-                    # Convert hash to a PDF filename that the viewer can recognize
-                    filename = f"{file_hash}.pdf"
-                
-                # Calculate scores if ground truth exists
-                scores = {}
-                mismatches = []
-                true_negatives = 0
-                iteration_scores = []
-                iteration_mismatches = []
-                # Legacy: iteration_true_negatives no longer needed (TN is encoded per-field as score 0.0)
-                
-                if ground_truth_data:
-                    # Apply extraction types filter if specified
-                    extraction_types = config.get('extraction_types', [])
-                    excluded_fields = config.get('excluded_fields', [])
+                        print(f"No ground truth found for {file_hash}: {str(e)}")
+                    
+                    api_responses = []
+                    for response_key, api_response in zip(response_keys, loaded_responses):
+                        if isinstance(api_response, Exception):
+                            print(f"Failed to load response {response_key}: {str(api_response)}")
+                        else:
+                            api_responses.append(api_response)
+                    
+                    if not api_responses:
+                        print(f"No valid responses found for {file_hash}")
+                        return None
+                    
+                    filename = file_hash  # Default fallback
                     
-                    filtered_ground_truth = ground_truth_data
-                    if extraction_types:
-                        filtered_ground_truth = filter_ground_truth_by_extraction_types(filtered_ground_truth, extraction_types)
-                    if excluded_fields:
-                        filtered_ground_truth = remove_excluded_fields_from_ground_truth(filtered_ground_truth, excluded_fields)
+                    # Runs record the original names in their metadata. Otherwise the API response
+                    # echoes the name the PDF was uploaded under (its original name tag), so the
+                    # S3 tag lookup is only needed for responses without one
+                    recorded_names = metadata.get('files')
+                    if recorded_names is not None and file_hash in recorded_names:
+                        filename = unquote_plus(recorded_names[file_hash])
+                    elif 'filename' in api_responses[0]:
+                        filename = api_responses[0]['filename']
+                    elif recorded_names is None:
+                        filename = await _original_filename_from_tags(file_hash, config)
                     
-                    # Calculate scores for each iteration
-                    for idx, api_response in enumerate(api_responses):
-                        iter_scores, iter_mismatches, iter_true_negatives = compare_extraction_results(filtered_ground_truth, api_response)
-                        iteration_scores.append(iter_scores)
-                        iteration_mismatches.append(iter_mismatches)
-                        # TN is encoded per-field in scores (0.0), no need to collect per-iteration TN
+                    # Final fallback: if we still have file_hash, try to construct a reasonable filename
+                    if filename == file_hash:
+                        # Convert hash to a PDF filename that the viewer can recognize
+                        filename = f"{file_hash}.pdf"
+                    
+                    # Calculate scores if ground truth exists
+                    scores = {}
+                    mismatches = []
+                    true_negatives = 0
+                    iteration_scores = []
+                    iteration_mismatches = []
+                    # Legacy: iteration_true_negatives no longer needed (TN is encoded per-field as score 0.0)
+                    
+                    if ground_truth_data:
+                        # Apply extraction types filter if specified
+                        extraction_types = config.get('extraction_types', [])
+                        excluded_fields = config.get('excluded_fields', [])
+                        
+                        filtered_ground_truth = ground_truth_data
+                        if extraction_types:
+                            filtered_ground_truth = filter_ground_truth_by_extraction_types(filtered_ground_truth, extraction_types)
+                        if excluded_fields:
+                            filtered_ground_truth = remove_excluded_fields_from_ground_truth(filtered_ground_truth, excluded_fields)
+                        
+                        # Flatten and normalize the ground truth once; it is the same for every iteration
+                        gt_flat, gt_norm = flatten_and_normalize(filtered_ground_truth)
+                        
+                        # Calculate scores for each iteration
+                        # Identical responses across iterations are only compared once
+                        results = compare_iteration_results(filtered_ground_truth, api_responses, gt_flat, gt_norm)
+                        for idx, (iter_scores, iter_mismatches, iter_true_negatives) in enumerate(results):
+                            iteration_scores.append(iter_scores)
+                            iteration_mismatches.append(iter_mismatches)
+                            # TN is encoded per-field in scores (0.0), no need to collect per-iteration TN
+                            
+                            # Use the last iteration for main scores
+                            if idx == len(api_responses) - 1:
+                                scores = iter_scores
+                                mismatches = iter_mismatches
+                                true_negatives = iter_true_negatives
                         
-                        # Use the last iteration for main scores
-                        if idx == len(api_responses) - 1:
-                            scores = iter_scores
-                            mismatches = iter_mismatches
-                            true_negatives = iter_true_negatives
                     
-                    if iteration_scores:
-                        all_scores.extend(iteration_scores)
-                
-                # Create document evaluation with proper model import
-                from ..api.v1.evaluation import DocumentEvaluation
-                document_eval = DocumentEvaluation(
-                    filename=filename,
-                    file_hash=file_hash,
-                    ground_truth=filtered_ground_truth if ground_truth_data else None,
-                    api_responses=api_responses,
-                    scores=scores,
-                    mismatches=mismatches,
-                    true_negatives=true_negatives,
-                    iteration_scores=iteration_scores if ground_truth_data else None,
-                    iteration_mismatches=iteration_mismatches if ground_truth_data else None
-                )
-                
+                    # Create document evaluation with proper model import
+                    from ..api.v1.evaluation import DocumentEvaluation
+                    document_eval = DocumentEvaluation(
+                        filename=filename,
+                        file_hash=file_hash,
+                        ground_truth=filtered_ground_truth if ground_truth_data else None,
+                        api_responses=api_responses,
+                        scores=scores,
+                        mismatches=mismatches,
+                        true_negatives=true_negatives,
+                        iteration_scores=iteration_scores if ground_truth_data else None,
+                        iteration_mismatches=iteration_mismatches if ground_truth_data else None
+                    )
+                    
+                    return document_eval, iteration_scores
+                    
+                except Exception as e:
+                    print(f"Failed to process file {file_hash}: {str(e)}")
+                    return None
+            
+        # gather keeps the listing order for documents and scores
+        file_results = await asyncio.gather(*(
+            load_file(file_hash, iterations) for file_hash, iterations in file_responses.items()
+        ))
+        for file_result in file_results:
+            if file_result is not None:
+                document_eval, iteration_scores = file_result
                 documents.append(document_eval)
-                
-            except Exception as e:
-                print(f"Failed to process file {file_hash}: {str(e)}")
-                continue
+                for scores in iteration_scores:
+                    metrics_accumulator.add(scores)
         
-        # Calculate overall metrics
-        if all_scores:
-            metrics = calculate_overall_metrics(all_scores)
-        else:
-            from .comparison_service import EvaluationMetrics
-            metrics = EvaluationMetrics(
-                true_positives=0, false_positives=0, false_negatives=0, true_negatives=0,
-                precision=0.0, recall=0.0, f1_score=0.0, accuracy=0.0
-            )
+        # Calculate overall metrics (all zeros when nothing was scored)
+        metrics = metrics_accumulator.overall_metrics()
         
         # Create evaluation result with proper model import
         from ..api.v1.evaluation import EvaluationResult
@@ -262,21 +279,19 @@ async def check_missing_ground_truth(
         source_bucket, source_prefix = parse_s3_uri(source_data_uri)
         gt_bucket, gt_prefix = parse_s3_uri(ground_truth_uri)
         
-        # List source files
-        source_response = s3_client.list_objects_v2(Bucket=source_bucket, Prefix=source_prefix)
-        source_files = [obj['Key'] for obj in source_response.get('Contents', []) if obj['Key'].endswith('.pdf')]
-        
-        # List existing ground truth files
-        gt_response = s3_client.list_objects_v2(Bucket=gt_bucket, Prefix=gt_prefix)
-        existing_gt_files = {get_file_hash_from_key(obj['Key']): obj['Key'] 
-                           for obj in gt_response.get('Contents', []) if obj['Key'].endswith('.json')}
+        # List source files and existing ground truth files off the event loop, in parallel
+        source_objects, existing_gt_files = await asyncio.gather(
+            asyncio.to_thread(list_s3_objects, source_bucket, source_prefix),
+            asyncio.to_thread(get_ground_truth_index, gt_bucket, gt_prefix)
+        )
+        source_files = [obj['Key'] for obj in source_objects if obj['Key'].endswith('.pdf')]
         
         missing_files = []
         existing_files = []
         
         for source_key in source_files:
             file_hash = get_file_hash_from_key(source_key)
-            filename = source_key.split('/')[-1]
+            filename = source_key.rpartition('/')[2]
             
             if file_hash not in existing_gt_files:
                 missing_files.append({
@@ -307,33 +322,15 @@ async def list_source_files(source_data_uri: str):
     """List all source files with their original names from S3 tags."""
     try:
         source_bucket, source_prefix = parse_s3_uri(source_data_uri)
-        source_response = s3_client.list_objects_v2(Bucket=source_bucket, Prefix=source_prefix)
+        source_objects = await asyncio.to_thread(list_s3_objects, source_bucket, source_prefix)
         
-        files = []
-        for obj in source_response.get('Contents', []):
-            if obj['Key'].endswith('.pdf'):
-                try:
-                    # Get object tags to find original_name
-                    tag_response = s3_client.get_object_tagging(Bucket=source_bucket, Key=obj['Key'])
-                    original_name = None
-                    for tag in tag_response.get('TagSet', []):
-                        if tag['Key'] == 'original_name':
-                            original_name = tag['Value']
-                            break
-                    
-                    # Use original_name if found, otherwise fall back to key name
-                    filename = original_name if original_name else obj['Key'].split('/')[-1]
-                    files.append({
-                        'key': obj['Key'],
-                        'filename': filename
-                    })
-                except Exception as e:
-                    print(f"Failed to get tags for {obj['Key']}: {str(e)}")
-                    # Fall back to using key name if tag retrieval fails
-                    files.append({
-                        'key': obj['Key'],
-                        'filename': obj['Key'].split('/')[-1]
-                    })
+        # Tag lookups are independent round-trips; resolve them concurrently
+        semaphore = asyncio.Semaphore(TAGGING_CONCURRENCY)
+        files = list(await asyncio.gather(*(
+            resolve_source_filename(source_bucket, obj['Key'], semaphore)
+            for obj in source_objects
+            if obj['Key'].endswith('.pdf')
+        )))
         
         return {"files": files}
     except Exception as e:
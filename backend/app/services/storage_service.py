@@ -1,13 +1,38 @@
 """Service for S3 storage operations."""
+import asyncio
+import functools
 import json
+import os
+import threading
+import time
+from collections import OrderedDict
 import boto3
-from typing import Dict, Any
+import orjson
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from typing import Dict, List, Any, Optional, Tuple
 from urllib.parse import urlparse
 from fastapi import HTTPException
 from datetime import datetime
 
 
-s3_client = boto3.client("s3")
+# boto3 calls run in worker threads, so allow as many pooled connections as concurrent callers
+s3_client = boto3.client("s3", config=Config(max_pool_connections=32))
+
+# How long a ground truth listing is reused before S3 is listed again
+GROUND_TRUTH_INDEX_TTL = float(os.getenv("GROUND_TRUTH_INDEX_TTL", 60))
+
+# (bucket, prefix) -> (expiry time, {file_hash: key})
+_ground_truth_index_cache: Dict[Tuple[str, str], Tuple[float, Dict[str, str]]] = {}
+# bucket -> write generation; bumped on every invalidation so in-flight listings aren't cached
+_ground_truth_generations: Dict[str, int] = {}
+# Listings run in worker threads while invalidations run on the event loop
+_ground_truth_index_lock = threading.Lock()
+
+# Upper bound on the raw JSON bytes behind the parsed ground truth objects kept in memory.
+# Parsed Python objects usually take several times their raw size (5-10x is common), so the
+# process can hold a multiple of this; files larger than the limit are never cached.
+JSON_OBJECT_CACHE_MAX_BYTES = int(os.getenv("JSON_OBJECT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
 
 
 def parse_s3_uri(uri: str) -> tuple[str, str]:
@@ -18,21 +43,202 @@ def parse_s3_uri(uri: str) -> tuple[str, str]:
     return parsed.netloc, parsed.path.lstrip('/')
 
 
+# The same bucket keys are hashed by every listing endpoint and each evaluation run
+@functools.lru_cache(maxsize=65536)
 def get_file_hash_from_key(key: str) -> str:
     """Extract hash from S3 key like 'prefix/hash.ext'."""
-    filename = key.split('/')[-1]
-    return filename.split('.')[0]
+    # Partition splits once instead of building a list of every path segment
+    return key.rpartition('/')[2].partition('.')[0]
+
+
+def list_s3_objects(bucket: str, prefix: str) -> List[Dict[str, Any]]:
+    """List every object under a prefix, following continuation tokens past 1000 keys."""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    objects: List[Dict[str, Any]] = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        objects.extend(page.get('Contents', []))
+    return objects
+
+
+def get_ground_truth_index(bucket: str, prefix: str, refresh: bool = False) -> Dict[str, str]:
+    """
+    Map file hash -> key for the ground truth JSON files under a prefix, reusing the listing
+    for GROUND_TRUTH_INDEX_TTL seconds unless `refresh` is set. Blocking; run via
+    asyncio.to_thread. The returned dict is shared between callers and must not be mutated.
+    """
+    now = time.monotonic()
+    with _ground_truth_index_lock:
+        cached = _ground_truth_index_cache.get((bucket, prefix))
+        generation = _ground_truth_generations.get(bucket, 0)
+    if not refresh and cached is not None and cached[0] > now:
+        return cached[1]
+    
+    index = {get_file_hash_from_key(obj['Key']): obj['Key']
+             for obj in list_s3_objects(bucket, prefix) if obj['Key'].endswith('.json')}
+    with _ground_truth_index_lock:
+        # A write during the listing may be missing from it; use it once but don't cache it
+        if _ground_truth_generations.get(bucket, 0) == generation:
+            _ground_truth_index_cache[(bucket, prefix)] = (now + GROUND_TRUTH_INDEX_TTL, index)
+    return index
+
+
+def invalidate_ground_truth_index(bucket: str) -> None:
+    """Drop cached ground truth listings for a bucket after writing ground truth to it."""
+    with _ground_truth_index_lock:
+        _ground_truth_generations[bucket] = _ground_truth_generations.get(bucket, 0) + 1
+        for cache_key in list(_ground_truth_index_cache):
+            if cache_key[0] == bucket:
+                del _ground_truth_index_cache[cache_key]
 
 
 async def fetch_s3_file_content(bucket: str, key: str) -> bytes:
     """Fetch file content from S3."""
     try:
-        response = s3_client.get_object(Bucket=bucket, Key=key)
-        return response['Body'].read()
+        return await asyncio.to_thread(_get_object_bytes, bucket, key)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch {key}: {str(e)}")
 
 
+def parse_json_bytes(body: bytes) -> Any:
+    """Parse JSON straight from bytes with orjson (no intermediate str decode)."""
+    try:
+        return orjson.loads(body)
+    except orjson.JSONDecodeError:
+        # Python's parser also accepts NaN/Infinity and arbitrarily large ints
+        return json.loads(body)
+
+
+def _get_object_bytes(bucket: str, key: str) -> bytes:
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    return response['Body'].read()
+
+
+class JsonObjectCache:
+    """
+    Thread-safe LRU of parsed JSON objects keyed by (bucket, key, ETag), bounded by the total
+    size of the raw bodies they were parsed from rather than by entry count.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key: Tuple[str, str, str]) -> Optional[Tuple[int, Any]]:
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+            return entry
+
+    def put(self, cache_key: Tuple[str, str, str], size: int, data: Any) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if cache_key in self._entries:
+                return
+            self._entries[cache_key] = (size, data)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (evicted_size, _) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+_json_object_cache = JsonObjectCache(JSON_OBJECT_CACHE_MAX_BYTES)
+
+
+def _load_json_object(bucket: str, key: str, etag: str) -> Any:
+    cache_key = (bucket, key, etag)
+    cached = _json_object_cache.get(cache_key)
+    if cached is not None:
+        return cached[1]
+    # IfMatch pins the GET to the ETag we cache under, so a concurrent overwrite fails instead of mis-caching
+    body = s3_client.get_object(Bucket=bucket, Key=key, IfMatch=etag)['Body'].read()
+    data = parse_json_bytes(body)
+    _json_object_cache.put(cache_key, len(body), data)
+    return data
+
+
+def _get_json_object(bucket: str, key: str) -> Any:
+    return parse_json_bytes(_get_object_bytes(bucket, key))
+
+
+def _is_precondition_failed(error: ClientError) -> bool:
+    return (error.response.get('Error', {}).get('Code') == 'PreconditionFailed'
+            or error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 412)
+
+
+def _fetch_json_object(bucket: str, key: str) -> Any:
+    etag = s3_client.head_object(Bucket=bucket, Key=key)['ETag']
+    try:
+        return _load_json_object(bucket, key, etag)
+    except ClientError as e:
+        if not _is_precondition_failed(e):
+            raise
+    # Overwritten between the HEAD and the GET; retry once against the new version
+    etag = s3_client.head_object(Bucket=bucket, Key=key)['ETag']
+    return _load_json_object(bucket, key, etag)
+
+
+async def fetch_s3_json(bucket: str, key: str) -> Any:
+    """
+    Fetch and parse a JSON file from S3, reusing the parsed object while its ETag is unchanged.
+    The result is shared between callers and must not be mutated.
+    """
+    try:
+        return await asyncio.to_thread(_fetch_json_object, bucket, key)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch {key}: {str(e)}")
+
+
+async def load_s3_json(bucket: str, key: str) -> Any:
+    """
+    Fetch and parse a one-off JSON file from S3 (no caching). Parsing runs in the same
+    worker thread as the download so large bodies don't block the event loop.
+    """
+    try:
+        return await asyncio.to_thread(_get_json_object, bucket, key)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch {key}: {str(e)}")
+
+
+def dump_json_bytes(data: Any, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes with orjson (no intermediate str encode)."""
+    option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+    try:
+        return orjson.dumps(data, option=option)
+    except TypeError:
+        # Python's encoder also handles ints beyond 64 bits and other types orjson rejects
+        return json.dumps(data, indent=2 if indent else None).encode('utf-8')
+
+
+def put_json_object(bucket: str, key: str, data: Dict[str, Any]) -> None:
+    """Serialize data as indented JSON and upload it. Blocking; run via asyncio.to_thread."""
+    body = dump_json_bytes(data, indent=True)
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=body,
+        ContentType='application/json'
+    )
+
+
+# Every save during a run resolves the same responses URI and run ID
+@functools.lru_cache(maxsize=256)
+def get_run_base(responses_uri: str, evaluation_run_id: str) -> Tuple[str, str]:
+    """Return (bucket, key prefix) for an evaluation run's folder under the responses URI."""
+    responses_bucket, responses_prefix = parse_s3_uri(responses_uri)
+    if responses_prefix:
+        return responses_bucket, f"{responses_prefix.rstrip('/')}/{evaluation_run_id}"
+    return responses_bucket, evaluation_run_id
+
+
 def build_s3_paths(evaluation_run_id: str, file_hash: str, iteration: int) -> Dict[str, str]:
     """Build S3 paths for an evaluation run."""
     base_path = f"{evaluation_run_id}"
@@ -47,12 +253,13 @@ def build_s3_paths(evaluation_run_id: str, file_hash: str, iteration: int) -> Di
 async def save_evaluation_metadata_to_s3(
     evaluation_run_id: str,
     config: Dict[str, Any],
-    responses_uri: str
+    responses_uri: str,
+    files: Optional[Dict[str, str]] = None
 ) -> str:
-    """Save evaluation run metadata to S3."""
+    """Save evaluation run metadata to S3. `files` maps file hash -> original filename tag."""
     try:
-        # Parse responses S3 URI
-        responses_bucket, responses_prefix = parse_s3_uri(responses_uri)
+        # Resolve the run folder under the responses S3 URI
+        responses_bucket, run_base = get_run_base(responses_uri, evaluation_run_id)
         
         # Create metadata object
         metadata = {
@@ -61,23 +268,14 @@ async def save_evaluation_metadata_to_s3(
             "config": config,
             "status": "running"
         }
+        if files is not None:
+            metadata["files"] = files
         
         # Create S3 key for metadata
-        if responses_prefix:
-            s3_key = f"{responses_prefix.rstrip('/')}/{evaluation_run_id}/metadata.json"
-        else:
-            s3_key = f"{evaluation_run_id}/metadata.json"
+        s3_key = f"{run_base}/metadata.json"
         
-        # Convert to JSON string
-        json_content = json.dumps(metadata, indent=2)
-        
-        # Upload to S3
-        s3_client.put_object(
-            Bucket=responses_bucket,
-            Key=s3_key,
-            Body=json_content.encode('utf-8'),
-            ContentType='application/json'
-        )
+        # Serialize and upload off the event loop
+        await asyncio.to_thread(put_json_object, responses_bucket, s3_key, metadata)
         
         return f"s3://{responses_bucket}/{s3_key}"
         
@@ -92,25 +290,14 @@ async def save_evaluation_results_to_s3(
 ) -> str:
     """Save evaluation results to S3."""
     try:
-        # Parse responses S3 URI
-        responses_bucket, responses_prefix = parse_s3_uri(responses_uri)
+        # Resolve the run folder under the responses S3 URI
+        responses_bucket, run_base = get_run_base(responses_uri, evaluation_run_id)
         
         # Create S3 key for results
-        if responses_prefix:
-            s3_key = f"{responses_prefix.rstrip('/')}/{evaluation_run_id}/results/summary.json"
-        else:
-            s3_key = f"{evaluation_run_id}/results/summary.json"
-        
-        # Convert to JSON string
-        json_content = json.dumps(results, indent=2)
+        s3_key = f"{run_base}/results/summary.json"
         
-        # Upload to S3
-        s3_client.put_object(
-            Bucket=responses_bucket,
-            Key=s3_key,
-            Body=json_content.encode('utf-8'),
-            ContentType='application/json'
-        )
+        # Serialize and upload off the event loop
+        await asyncio.to_thread(put_json_object, responses_bucket, s3_key, results)
         
         return f"s3://{responses_bucket}/{s3_key}"
         
@@ -127,25 +314,14 @@ async def save_iteration_response_to_s3(
 ) -> str:
     """Save API response iteration to S3 using new evaluation run structure."""
     try:
-        # Parse responses S3 URI
-        responses_bucket, responses_prefix = parse_s3_uri(responses_uri)
+        # Resolve the run folder under the responses S3 URI
+        responses_bucket, run_base = get_run_base(responses_uri, evaluation_run_id)
         
         # Create S3 key using new structure: evaluation_runs/{run_id}/responses/{file_hash}/{iteration}.json
-        if responses_prefix:
-            s3_key = f"{responses_prefix.rstrip('/')}/{evaluation_run_id}/responses/{file_hash}/{iteration}.json"
-        else:
-            s3_key = f"{evaluation_run_id}/responses/{file_hash}/{iteration}.json"
-        
-        # Convert response to JSON string
-        json_content = json.dumps(response_data, indent=2)
+        s3_key = f"{run_base}/responses/{file_hash}/{iteration}.json"
         
-        # Upload to S3
-        s3_client.put_object(
-            Bucket=responses_bucket,
-            Key=s3_key,
-            Body=json_content.encode('utf-8'),
-            ContentType='application/json'
-        )
+        # Serialize and upload off the event loop
+        await asyncio.to_thread(put_json_object, responses_bucket, s3_key, response_data)
         
         return f"s3://{responses_bucket}/{s3_key}"
         
@@ -0,0 +1,17 @@
+"""Comparison helpers must not mutate their inputs (ground truth objects are cached and shared)."""
+import copy
+
+from app.services import comparison_service
+
+
+def test_flatten_keyed_array_merge_does_not_mutate_input(monkeypatch):
+    monkeypatch.setitem(comparison_service.ARRAY_KEY_FIELDS, "meds", comparison_service._build_selector(["name"]))
+    # Items sharing a semantic key collect into lists; the first value here is itself a list from the input
+    data = {"meds": [{"name": "a", "v": [[1, 2]]}, {"name": "a", "v": [[3]]}, {"name": "a", "v": [[4]]}]}
+    before = copy.deepcopy(data)
+
+    first = comparison_service.flatten_json_for_comparison(data)
+    second = comparison_service.flatten_json_for_comparison(data)
+
+    assert data == before
+    assert first == second == {"meds[a].name": ["a", "a", "a"], "meds[a].v[0]": [1, 2, [3], [4]]}
@@ -0,0 +1,106 @@
+"""FastCORSMiddleware must send the same CORS headers as Starlette's CORSMiddleware."""
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.cors import FastCORSMiddleware
+
+ALLOWED = "http://allowed.example"
+OTHER = "http://other.example"
+
+# Explicit method lists: Starlette's "*" expansion varies between versions
+CONFIGS = {
+    "app": dict(allow_origins=[ALLOWED], allow_credentials=True,
+                allow_methods=["GET", "POST", "PUT"], allow_headers=["*"]),
+    "wildcard_origin": dict(allow_origins=["*"], allow_methods=["GET", "POST"], allow_headers=["X-Token"]),
+    "wildcard_credentials": dict(allow_origins=["*"], allow_credentials=True,
+                                 allow_methods=["GET"], allow_headers=["X-Token"]),
+}
+
+REQUESTS = {
+    "no_origin": ("GET", {}),
+    "simple_allowed": ("GET", {"Origin": ALLOWED}),
+    "simple_disallowed": ("GET", {"Origin": OTHER}),
+    "preflight_allowed": ("OPTIONS", {"Origin": ALLOWED, "Access-Control-Request-Method": "POST",
+                                      "Access-Control-Request-Headers": "x-token, content-type"}),
+    "preflight_disallowed_origin": ("OPTIONS", {"Origin": OTHER, "Access-Control-Request-Method": "GET"}),
+    "preflight_bad_method": ("OPTIONS", {"Origin": ALLOWED, "Access-Control-Request-Method": "DELETE"}),
+    "preflight_bad_header": ("OPTIONS", {"Origin": ALLOWED, "Access-Control-Request-Method": "GET",
+                                         "Access-Control-Request-Headers": "x-other"}),
+}
+
+
+async def endpoint(request):
+    # Endpoint-set Vary must be merged with Origin, not duplicated
+    return PlainTextResponse("hello", headers={"Vary": "Accept-Encoding"})
+
+
+def make_client(middleware_cls, config):
+    app = Starlette(
+        routes=[Route("/", endpoint, methods=["GET", "POST", "OPTIONS"])],
+        middleware=[Middleware(middleware_cls, **config)],
+    )
+    return TestClient(app)
+
+
+def cors_headers(response):
+    return sorted(
+        (k.lower(), v) for k, v in response.headers.multi_items()
+        if k.lower().startswith("access-control-") or k.lower() == "vary"
+    )
+
+
+@pytest.mark.parametrize("config_name", CONFIGS)
+@pytest.mark.parametrize("request_name", REQUESTS)
+def test_matches_starlette(config_name, request_name):
+    config = CONFIGS[config_name]
+    method, headers = REQUESTS[request_name]
+    expected = make_client(CORSMiddleware, config).request(method, "/", headers=headers)
+    actual = make_client(FastCORSMiddleware, config).request(method, "/", headers=headers)
+
+    assert actual.status_code == expected.status_code
+    assert actual.text == expected.text
+    assert cors_headers(actual) == cors_headers(expected)
+
+
+def test_vary_origin_on_every_simple_response():
+    client = make_client(FastCORSMiddleware, CONFIGS["app"])
+    for headers in ({}, {"Origin": ALLOWED}, {"Origin": OTHER}):
+        response = client.get("/", headers=headers)
+        assert response.headers.get_list("vary") == ["Accept-Encoding, Origin"]
+
+
+def test_simple_request_origin_handling():
+    client = make_client(FastCORSMiddleware, CONFIGS["app"])
+
+    allowed = client.get("/", headers={"Origin": ALLOWED})
+    assert allowed.headers["access-control-allow-origin"] == ALLOWED
+    assert allowed.headers["access-control-allow-credentials"] == "true"
+
+    disallowed = client.get("/", headers={"Origin": OTHER})
+    assert "access-control-allow-origin" not in disallowed.headers
+    assert disallowed.headers["access-control-allow-credentials"] == "true"
+
+    no_origin = client.get("/")
+    assert "access-control-allow-origin" not in no_origin.headers
+    assert "access-control-allow-credentials" not in no_origin.headers
+
+
+def test_preflight():
+    client = make_client(FastCORSMiddleware, CONFIGS["app"])
+
+    ok = client.options("/", headers=REQUESTS["preflight_allowed"][1])
+    assert ok.status_code == 200
+    assert ok.headers["access-control-allow-origin"] == ALLOWED
+    assert ok.headers["access-control-allow-headers"] == "x-token, content-type"
+    assert ok.headers["vary"].startswith("Origin, Access-Control-Request-Method, Access-Control-Request-Headers")
+
+    rejected = client.options("/", headers=REQUESTS["preflight_disallowed_origin"][1])
+    assert rejected.status_code == 400
+    assert rejected.text == "Disallowed CORS origin"
+    assert "access-control-allow-origin" not in rejected.headers
+    assert rejected.headers["vary"] == ok.headers["vary"]
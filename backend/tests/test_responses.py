@@ -0,0 +1,33 @@
+"""ORJSONResponse must produce the same wire format as FastAPI's jsonable_encoder."""
+import datetime
+from decimal import Decimal
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.core.responses import ORJSONResponse, json_default
+
+
+def test_db_column_types_match_jsonable_encoder():
+    row = {
+        "time": datetime.timedelta(hours=1, seconds=30),
+        "integral": Decimal("5"),
+        "scaled": Decimal("5E+2"),
+        "fractional": Decimal("5.25"),
+        "one_point_zero": Decimal("1.0"),
+        "datetime": datetime.datetime(2024, 1, 2, 3, 4, 5),
+        "date": datetime.date(2024, 1, 2),
+    }
+    assert ORJSONResponse(row).body == orjson.dumps(jsonable_encoder(row))
+
+
+def test_stream_rows_use_the_same_encoding():
+    # /db-query/ stream mode serializes rows with json_default directly
+    row = {"time": datetime.timedelta(minutes=2), "integral": Decimal("7")}
+    assert orjson.loads(orjson.dumps(row, default=json_default)) == {"time": 120.0, "integral": 7}
+
+
+def test_ints_beyond_64_bits_fall_back_to_the_stdlib_encoder():
+    row = {"big": 2**70, "integral": Decimal("123456789012345678901234567890"), "time": datetime.timedelta(seconds=5)}
+    assert ORJSONResponse(row).body == JSONResponse(jsonable_encoder(row)).body
@@ -0,0 +1,68 @@
+"""Ground truth JSON loading: ETag-pinned caching, overwrite retries and the byte bound."""
+import io
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.services import storage_service
+
+
+class FakeS3:
+    """Minimal head_object/get_object stand-in whose object can be overwritten between calls."""
+
+    def __init__(self, versions):
+        self.versions = list(versions)  # (etag, body) served in turn by successive HEADs
+        self.current = 0
+        self.gets = 0
+
+    def head_object(self, Bucket, Key):
+        etag, body = self.versions[self.current]
+        return {'ETag': etag, 'ContentLength': len(body)}
+
+    def get_object(self, Bucket, Key, IfMatch=None):
+        self.gets += 1
+        etag, body = self.versions[self.current]
+        if IfMatch is not None and IfMatch != etag:
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'},
+                               'ResponseMetadata': {'HTTPStatusCode': 412}}, 'GetObject')
+        return {'Body': io.BytesIO(body)}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = storage_service.JsonObjectCache(max_bytes=32)
+    monkeypatch.setattr(storage_service, "_json_object_cache", cache)
+    return cache
+
+
+def test_overwrite_between_head_and_get_is_retried(monkeypatch, cache):
+    s3 = FakeS3([('"v1"', b'{"a": 1}'), ('"v2"', b'{"a": 2}')])
+    original_get = s3.get_object
+
+    def get_after_overwrite(**kwargs):
+        s3.current = 1
+        return original_get(**kwargs)
+
+    s3.get_object = get_after_overwrite
+    monkeypatch.setattr(storage_service, "s3_client", s3)
+
+    assert storage_service._fetch_json_object("bucket", "gt.json") == {"a": 2}
+    assert cache.get(("bucket", "gt.json", '"v2"')) is not None
+
+
+def test_cache_is_bounded_by_body_bytes(monkeypatch, cache):
+    s3 = FakeS3([('"v1"', b'{"a": "' + b"x" * 10 + b'"}')])
+    monkeypatch.setattr(storage_service, "s3_client", s3)
+
+    storage_service._fetch_json_object("bucket", "one.json")
+    storage_service._fetch_json_object("bucket", "one.json")
+    assert s3.gets == 1
+
+    storage_service._fetch_json_object("bucket", "two.json")
+    storage_service._fetch_json_object("bucket", "three.json")
+    assert cache.total_bytes <= cache.max_bytes
+    assert cache.get(("bucket", "one.json", '"v1"')) is None
+
+    s3.versions = [('"big"', b'{"a": "' + b"x" * 64 + b'"}')]
+    storage_service._fetch_json_object("bucket", "big.json")
+    assert cache.get(("bucket", "big.json", '"big"')) is None
@@ -118,5 +118,5 @@ fi
 # 6) Start FastAPI backend with Uvicorn (development mode)
 echo "🚀  Starting FastAPI backend (auto-reload enabled)"
 pushd "$PROJECT_ROOT/backend" >/dev/null || exit 1
-uvicorn main:app --reload
+uvicorn main:app --reload --loop uvloop --http httptools
 popd >/dev/null 
\ No newline at end of file